@@ -0,0 +1,40 @@
+"""Measure how long parsing the data files takes, and how much memory it allocates.
+
+Run from the repository root with the package importable, e.g.
+
+    $ PYTHONPATH=src python3 benchmarks/loading.py
+
+Prints the time and the peak allocation traced by tracemalloc for parsing the data
+files listed in config.json into mappings, and for compiling those into a table,
+which is what happens at runtime when there is no up-to-date compiled artifact.
+"""
+
+import timeit
+import tracemalloc
+
+from hkscs_unicode_converter import _loader
+
+
+def measure(function):
+    # Returns the best time in seconds and the peak allocation in bytes for calling function
+    seconds = min(timeit.repeat(function, number=1, repeat=5))
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+if __name__ == "__main__":
+    _, files = _loader.load_config()
+    cases = [
+        ("load_mappings", lambda: _loader.load_mappings(files)),
+        ("compile_table", lambda: _loader.compile_table(_loader.load_mappings(files))),
+    ]
+
+    print("%-16s %10s %16s" % ("", "time (ms)", "peak alloc (kB)"))
+    for name, function in cases:
+        seconds, peak = measure(function)
+        print("%-16s %10.1f %16.0f" % (name, seconds * 1000, peak / 1024))
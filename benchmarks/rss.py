@@ -0,0 +1,108 @@
+"""Compare the memory each worker of a prefork server uses for the mapping tables.
+
+Run from the repository root with the package importable, e.g.
+
+    $ PYTHONPATH=src python3 benchmarks/rss.py --workers 32
+
+Forks the given number of workers for each way of loading the tables, has each
+one convert every mappable character, and prints the average growth of each
+worker's proportional set size (PSS, which splits shared pages between the
+processes sharing them) and private memory. Linux only, since it reads
+/proc/self/smaps_rollup.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from hkscs_unicode_converter import build, converter
+from hkscs_unicode_converter.mapped import MappedTable, pack_table
+
+
+def memory():
+    # Returns (PSS, private) in kB for the current process
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Pss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def run_workers(count, load):
+    # Each worker loads the tables, converts every mappable character,
+    # then waits until every worker is done so that shared pages are counted as shared
+    text = "".join([chr(codepoint) for codepoint in range(0xE000, 0xF900)])
+    results, barrier = os.pipe(), os.pipe()
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            before = memory()
+            convert = load()
+            convert(text)
+            after = memory()
+            growth = (after[0] - before[0], after[1] - before[1])
+            os.write(results[1], b"%d %d\n" % growth)
+            os.read(barrier[0], 1)
+            os._exit(0)
+        pids.append(pid)
+
+    with os.fdopen(results[0]) as f:
+        os.close(results[1])
+        samples = [tuple(map(int, f.readline().split())) for _ in range(count)]
+    os.write(barrier[1], b"x" * count)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    os.close(barrier[0])
+    os.close(barrier[1])
+
+    return (
+        sum([pss for pss, _ in samples]) / count,
+        sum([private for _, private in samples]) / count,
+    )
+
+
+def main():
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("This benchmark needs /proc/self/smaps_rollup (Linux 4.14+)")
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "compiled.bin")
+        with open(path, "wb") as f:
+            f.write(pack_table(build._compile()[2]))
+
+        def load_per_worker():
+            converter.warmup()
+            return converter.convert_string
+
+        def load_mapped():
+            return MappedTable(path).convert_string
+
+        results = [
+            ("tables loaded in each worker", run_workers(args.workers, load_per_worker))
+        ]
+
+        # Tables loaded before forking start out shared,
+        # but reference counting dirties their pages
+        converter.warmup()
+        results.append(
+            ("tables loaded before forking", run_workers(args.workers, load_per_worker))
+        )
+
+        results.append(("mmap binary table", run_workers(args.workers, load_mapped)))
+
+    print("%d workers, average growth per worker:" % args.workers)
+    print("%-30s %10s %12s" % ("", "PSS (kB)", "private (kB)"))
+    for name, (pss, private) in results:
+        print("%-30s %10.0f %12.0f" % (name, pss, private))
+
+
+if __name__ == "__main__":
+    main()
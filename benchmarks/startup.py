@@ -0,0 +1,104 @@
+"""Measure how long a new process takes to import the converter and load the tables.
+
+Run from the repository root, e.g.
+
+    $ python3 benchmarks/startup.py --repeat 10
+
+Each case copies the package (without its tests) into a temporary directory or a zip
+file, alongside one of the compiled artifacts, and prints the best time over --repeat
+processes. Importing the package from a zip file is how it's loaded from a zipapp or a
+zipped package, where the bytecode of the generated module isn't cached, so its source
+is compiled every time it's imported.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "src")
+sys.path.insert(0, SOURCE)
+
+from hkscs_unicode_converter import _lookup, build  # noqa: E402
+
+PACKAGE = "hkscs_unicode_converter"
+
+CODE = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "from hkscs_unicode_converter import converter\n"
+    "converter.warmup()\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def copy_package(directory, artifacts):
+    # Copies the package into directory, adding artifacts (file name -> contents) to its data directory
+    destination = os.path.join(directory, PACKAGE)
+    shutil.copytree(
+        os.path.join(SOURCE, PACKAGE),
+        destination,
+        ignore=shutil.ignore_patterns("test", "__pycache__", "_compiled.py", "*.blob"),
+    )
+    for name, contents in artifacts.items():
+        with open(os.path.join(destination, "data", name), "wb") as f:
+            f.write(contents)
+    return directory
+
+
+def zip_package(directory, artifacts):
+    # Copies the package into a zip file in directory, without any bytecode
+    package = copy_package(os.path.join(directory, "package"), artifacts)
+    path = os.path.join(directory, "package.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for parent, _, names in os.walk(package):
+            for name in names:
+                file = os.path.join(parent, name)
+                archive.write(file, os.path.relpath(file, package))
+    return path
+
+
+def startup(path, repeat):
+    # Returns the best time in seconds to import the package from path and load the tables
+    # Point the cache somewhere empty, so tables compiled by earlier runs aren't reused
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPATH=path, HKSCS_UNICODE_CONVERTER_CACHE=cache)
+        times = []
+        for _ in range(repeat):
+            result = subprocess.run(
+                [sys.executable, "-c", CODE],
+                env=env,
+                check=True,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            times.append(float(result.stdout))
+        return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    module = build.generate_module().encode("ascii")
+    blob = build.generate_blob()
+    cases = [
+        ("compiled.json", {}),
+        ("python module", {f"{_lookup.GENERATED_MODULE}.py": module}),
+        ("blob", {_lookup.BLOB_NAME: blob}),
+    ]
+
+    print("%-16s %14s %14s" % ("", "directory (ms)", "zip file (ms)"))
+    for name, artifacts in cases:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [
+                copy_package(os.path.join(directory, "directory"), artifacts),
+                zip_package(os.path.join(directory, "zip"), artifacts),
+            ]
+            times = [startup(path, args.repeat) for path in paths]
+        print("%-16s %14.1f %14.1f" % (name, times[0] * 1000, times[1] * 1000))
@@ -0,0 +1,147 @@
+"""Calibrate the thresholds convert_string uses to choose a conversion strategy.
+
+Run from the repository root with the package importable, e.g.
+
+    $ PYTHONPATH=src python3 benchmarks/strategies.py
+
+Prints the timings of each strategy and the recommended values for
+SHORT_STRING_LENGTH, SAMPLE_LENGTH and DENSE_SAMPLE_RATIO in converter.py.
+"""
+
+import random
+import timeit
+
+from hkscs_unicode_converter import converter
+
+BASE_TEXT = "唔該你幫我睇下呢個字點樣寫 hello world, 今日天氣好好。"
+LONG_LENGTH = 100000
+SHORT_LENGTHS = [4, 8, 16, 32, 64, 128, 256, 512, 1024]
+SAMPLE_LENGTHS = [16, 32, 64, 128, 256, 512]
+# Strings longer than SHORT_STRING_LENGTH that SAMPLE_LENGTH is calibrated on
+SAMPLED_LENGTHS = [2048, 16384, LONG_LENGTH]
+DENSITIES = [0, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1]
+
+
+def make_text(length, density, seed=0):
+    # Replace a fraction of BASE_TEXT with characters that need converting
+    rng = random.Random(seed)
+    text = list((BASE_TEXT * (length // len(BASE_TEXT) + 1))[:length])
+    keys = sorted(converter.translation_table)
+    for index in rng.sample(range(length), int(length * density)):
+        text[index] = chr(rng.choice(keys))
+    return "".join(text)
+
+
+def best_time(function, text):
+    # function is called with the loaded tables and text
+    number = max(1, 200000 // len(text))
+    tables = converter._get_tables()
+    return (
+        min(timeit.repeat(lambda: function(tables, text), number=number, repeat=5))
+        / number
+    )
+
+
+def direct(tables, text):
+    # What convert_string does for strings up to SHORT_STRING_LENGTH
+    if tables.pattern.search(text) is None:
+        return text
+    return converter._convert_bulk(tables, text)
+
+
+def sampled(tables, text, sample_length=None):
+    # What convert_string does for longer strings
+    sample = text[: sample_length or converter.SAMPLE_LENGTH]
+    matches = len(tables.pattern.findall(sample))
+    if matches >= converter.DENSE_SAMPLE_RATIO * len(sample):
+        return converter._convert_bulk(tables, text)
+    return converter._convert_sparse(tables, text)
+
+
+def calibrate_density():
+    print("%d characters" % LONG_LENGTH)
+    print("%8s %12s %12s" % ("density", "bulk (ms)", "sparse (ms)"))
+    ratio = None
+    for density in DENSITIES:
+        text = make_text(LONG_LENGTH, density)
+        bulk = best_time(converter._convert_bulk, text)
+        sparse = best_time(converter._convert_sparse, text)
+        print("%8g %12.3f %12.3f" % (density, bulk * 1000, sparse * 1000))
+        if ratio is None and bulk <= sparse:
+            ratio = density
+    return ratio
+
+
+def calibrate_length():
+    print("%8s %12s %12s" % ("length", "direct (us)", "sampled (us)"))
+    length = None
+    for candidate in SHORT_LENGTHS:
+        texts = [make_text(candidate, density) for density in DENSITIES]
+        direct_total = sum([best_time(direct, text) for text in texts])
+        sampled_total = sum([best_time(sampled, text) for text in texts])
+        print(
+            "%8d %12.3f %12.3f"
+            % (
+                candidate,
+                direct_total / len(texts) * 1e6,
+                sampled_total / len(texts) * 1e6,
+            )
+        )
+        if direct_total <= sampled_total:
+            length = candidate
+
+    # The crossover can only be placed between two of the lengths that were timed
+    if length is None:
+        print("Sampling was faster at every length, even %d" % SHORT_LENGTHS[0])
+        length = SHORT_LENGTHS[0]
+    elif length == SHORT_LENGTHS[-1]:
+        print(
+            "Converting directly was still faster at %d, so the crossover is above"
+            " the lengths tested: add longer ones to SHORT_LENGTHS" % length
+        )
+    return length
+
+
+def calibrate_sample_length():
+    # A longer sample tells sparse and dense strings apart more reliably, but costs more to scan.
+    # Each candidate is scored by its time relative to the fastest candidate on the same text, averaged over the texts
+    texts = [
+        make_text(length, density)
+        for length in SAMPLED_LENGTHS
+        for density in DENSITIES
+    ]
+    times = [
+        [
+            best_time(lambda tables, text: sampled(tables, text, sample_length), text)
+            for text in texts
+        ]
+        for sample_length in SAMPLE_LENGTHS
+    ]
+    fastest = [min(column) for column in zip(*times)]
+
+    print("%8s %12s" % ("sample", "relative"))
+    scores = []
+    for sample_length, row in zip(SAMPLE_LENGTHS, times):
+        scores.append(sum([time / best for time, best in zip(row, fastest)]) / len(row))
+        print("%8d %12.3f" % (sample_length, scores[-1]))
+
+    best = SAMPLE_LENGTHS[scores.index(min(scores))]
+    if best in (SAMPLE_LENGTHS[0], SAMPLE_LENGTHS[-1]):
+        print(
+            "The best sample length is at the end of the lengths tested,"
+            " so a better one may lie outside them: extend SAMPLE_LENGTHS"
+        )
+    return best
+
+
+if __name__ == "__main__":
+    ratio = calibrate_density()
+    print()
+    length = calibrate_length()
+    print()
+    sample_length = calibrate_sample_length()
+    print()
+    print("Recommended thresholds:")
+    print("SHORT_STRING_LENGTH = %d" % length)
+    print("SAMPLE_LENGTH = %d" % sample_length)
+    print("DENSE_SAMPLE_RATIO = %g" % (ratio if ratio is not None else 1))
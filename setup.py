@@ -23,6 +23,6 @@ setuptools.setup(
     ],
     package_dir={"": "src"},
     packages=setuptools.find_packages(where="src"),
-    package_data={"": ["*.tsv", "*.json"]},
+    package_data={"": ["*.tsv", "*.json", "*.delta", "*.blob"]},
     python_requires=">=3.7",
 )
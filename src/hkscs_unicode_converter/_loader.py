@@ -0,0 +1,586 @@
+# Parses the data files listed in config.json and compiles them into a single table,
+# or reads the artifact built from them by `python3 -m hkscs_unicode_converter.build`
+import contextlib
+import csv
+import hashlib
+import importlib.resources as pkg_resources
+import json
+import logging
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from . import data
+
+_logger = logging.getLogger(__name__)
+
+
+def _format_key_value_pair(key, value):
+    if (not key or not value) or (key == value):
+        return (None, None)
+
+    # Strip off "U+" from the start of the keys and values
+    if key.startswith("U+"):
+        key = key[2:]
+    if value.startswith("U+"):
+        value = value[2:]
+
+    values = tuple([value])
+
+    # Special case for Ê̄, Ê̌, ê̄, ê̌ (<00CA,0304>, <00CA,030C>, <00EA,0304>, <00EA,030C>)
+    # Strip the "<" and ">" characters, then put each codepoint in the list
+    if value.startswith("<") and value.endswith(">"):
+        value = value[1:-1]
+        values = tuple(value.split(","))
+
+    return (key, values)
+
+
+def _create_mapping(items, columns_from, column_to):
+    # Each key in this mapping should be a single codepoint, represented as all-caps hexadecimal string with no prefix
+    # Each value should be a list of corresponding codepoints (represented the same way as the keys)
+    mapping = {}
+
+    for item in items:
+        for column_from in columns_from:
+            key, value = _format_key_value_pair(item[column_from], item[column_to])
+            if key and value:
+                mapping[key] = value
+
+    return mapping
+
+
+def _process_tsv(stream, columns):
+    # Yields a dict for each row, containing only the given columns,
+    # so that rows are never all kept in memory at once
+    reader = csv.reader(stream, delimiter="\t")
+    headers = next(reader)  # First line contains header titles
+    indices = [(column, headers.index(column)) for column in columns]
+
+    for row in reader:
+        yield {
+            column: row[index] if index < len(row) else "" for column, index in indices
+        }
+
+
+def _process_json(stream, columns):
+    # Returns a list with a dict for each entry, containing only the given columns,
+    # so that unused fields like cangjie or cantonese are dropped as soon as each entry is parsed
+    def keep_columns(item):
+        return {column: item[column] for column in columns if column in item}
+
+    return json.loads("".join(stream), object_hook=keep_columns)
+
+
+def _read_data(name, data_dir=None):
+    # Returns the contents of a file in data_dir, or in the package's data directory if data_dir is None
+    if data_dir is None:
+        return pkg_resources.read_binary(data, name)
+    with open(os.path.join(data_dir, name), "rb") as f:
+        return f.read()
+
+
+def _open_text(name, data_dir=None):
+    # Opens a file in data_dir (or the package's data directory) as text
+    if data_dir is None:
+        return pkg_resources.open_text(data, name)
+    return open(os.path.join(data_dir, name), encoding="utf-8")
+
+
+# A data file that is nearly identical to another one (e.g. a later revision of HKSCS that only changes a few rows)
+# can be stored as a delta over it, in a file ending in DELTA_SUFFIX. Its first line is DELTA_HEADER followed by
+# the name of the base file (which may be a delta too), then each line is an operation:
+# - "=N" copies the next N lines of the base file
+# - "-N" skips the next N lines of the base file
+# - "+line" inserts line
+# Any lines of the base file left after the last operation are skipped.
+DELTA_SUFFIX = ".delta"
+DELTA_HEADER = "#base "
+
+
+def _delta_base(name, f):
+    header = f.readline()
+    if not header.startswith(DELTA_HEADER):
+        raise ValueError(f"{name} is not a delta file")
+    return header[len(DELTA_HEADER) :].rstrip("\n")
+
+
+def _apply_delta(base, operations):
+    # Yields the lines encoded by operations over base, an iterator over the lines of the base file
+    for operation in operations:
+        if operation.startswith("+"):
+            yield operation[1:]
+        elif operation.startswith("="):
+            yield from islice(base, int(operation[1:]))
+        elif operation.startswith("-"):
+            for _ in islice(base, int(operation[1:])):
+                pass
+        else:
+            raise ValueError(f"Unknown delta operation {operation!r}")
+
+
+@contextlib.contextmanager
+def _open_data(name, data_dir=None):
+    # Opens a file in data_dir (or the package's data directory) as an iterable of lines of text,
+    # decoding it on the fly if it's a delta
+    with _open_text(name, data_dir) as f:
+        if not name.endswith(DELTA_SUFFIX):
+            yield f
+            return
+
+        base = _delta_base(name, f)
+        with _open_data(base, data_dir) as base_lines:
+            yield _apply_delta(iter(base_lines), f)
+
+
+def _data_names(name, data_dir=None):
+    # Returns name, followed by the name of each file it's a delta over
+    names = [name]
+    while names[-1].endswith(DELTA_SUFFIX):
+        with _open_text(names[-1], data_dir) as f:
+            names.append(_delta_base(names[-1], f))
+    return names
+
+
+def data_file_name(file):
+    # Returns the name of the file holding the data of an entry in config.json,
+    # which is given by "file" for data stored as a delta
+    return file.get("file", f'{file["name"]}.{file["type"]}')
+
+
+def load_config(data_dir=None):
+    # Returns the raw contents of config.json, and the config parsed from it
+    config = _read_data("config.json", data_dir)
+    return config, json.loads(config)
+
+
+def filter_revision(files, revision):
+    # Returns the files that were part of the standard as of revision (e.g. 2004 for HKSCS-2004).
+    # Files without a revision, like those in overlays, are always included.
+    revisions = [file["revision"] for file in files if "revision" in file]
+    if revisions and revision < min(revisions):
+        raise ValueError(f"revision must be at least {min(revisions)}")
+    return [file for file in files if file.get("revision", revision) <= revision]
+
+
+def filter_names(files, names):
+    # Returns the files whose name is in names, in the order they're listed in
+    unknown = set(names) - set([file["name"] for file in files])
+    if unknown:
+        raise ValueError("unknown files: %s" % ", ".join(sorted(unknown)))
+    return [file for file in files if file["name"] in names]
+
+
+def load_mappings(files, data_dir=None):
+    mappings = []
+    # Start parsing the data files
+    for file in files:
+        # There might be multiple columns that we are interested in converting FROM
+        # (e.g. in HKSCS2004,
+        #  we want both ISO/IEC_10646-1:2000 -> ISO/IEC_10646:2003_Amendment AND
+        #  ISO/IEC_10646-1:1993 -> ISO/IEC_10646:2003_Amendment)
+        columns_from = file["config"]["column_from_keys"]
+        column_to = file["config"]["column_key_to"]
+        columns = [*columns_from, column_to]
+
+        # Each of the _process functions should return an iterable of dicts
+        # Each dict represents a row; each key in the dict is the column name
+        with _open_data(data_file_name(file), data_dir) as f:
+            if file["type"] == "tsv":
+                items = _process_tsv(f, columns)
+            else:
+                items = _process_json(f, columns)
+
+            mappings.append(_create_mapping(items, columns_from, column_to))
+
+    return mappings
+
+
+# The mappings parsed in this process, keyed by mapping_key(), so that each data file is only parsed once
+# however many selections of the mappings it's compiled into (e.g. one per Converter, or per revision).
+# They are shared between those, so they must never be changed
+_shared_mappings = {}
+
+
+def mapping_key(file, data_dir=None):
+    # Returns a hash of what the mapping parsed from file depends on: the columns it's read from,
+    # and the contents of its data file (including the files that deltas are based on)
+    digest = hashlib.sha256()
+    columns = json.dumps([file["type"], file["config"]], sort_keys=True)
+    digest.update(columns.encode("utf-8"))
+    for name in _data_names(data_file_name(file), data_dir):
+        contents = _read_data(name, data_dir)
+        digest.update(b"\0%d\0" % len(contents))
+        digest.update(contents)
+    return digest.hexdigest()
+
+
+def load_shared_mappings(files, data_dir=None):
+    # Returns the same as load_mappings(), only parsing the files that haven't been parsed in this process yet
+    mappings = []
+    for file in files:
+        key = mapping_key(file, data_dir)
+        mapping = _shared_mappings.get(key)
+        if mapping is None:
+            (mapping,) = load_mappings([file], data_dir)
+            _shared_mappings[key] = mapping
+        mappings.append(mapping)
+    return mappings
+
+
+def _follow(path, mapping):
+    # Follow the last value of path through mapping, if it's one of its keys
+    matched = path[-1]
+    if type(matched) is str and matched in mapping:
+        matched = mapping[matched]
+        # A tuple should only occur for the <00CA,0304> edgecases, and isn't followed any further
+        path.append(matched if len(matched) > 1 else matched[0])
+
+
+def _resolve(codepoint, mappings):
+    # Follow a codepoint through each of the mappings in order, because a codepoint may be remapped twice
+    # e.g. EC77 (GCCS) -> 4CA4 (HKSCS-1999) -> 9FD0 (HKSCS-2016)
+    # Returns every intermediate value, starting with the codepoint itself
+    path = [codepoint]
+    for mapping in mappings:
+        _follow(path, mapping)
+
+    return path
+
+
+def _format_output(matched):
+    # There are three possibilities:
+    # - matched is a tuple length 2, for sequences like <00CA,0304>
+    # - matched is a str length 1 and contains a Unicode literal, e.g. "亠"
+    # - matched is a str length > 1, and contains a Unicode codepoint e.g. "39FB"
+    # Returns None if matched can't be turned into a string
+    try:
+        if type(matched) is tuple and len(matched) > 1:
+            return "".join([chr(int(codepoint, 16)) for codepoint in matched])
+        elif type(matched) is str and len(matched) == 1:
+            return matched
+        elif type(matched) is str and len(matched) > 1:
+            return chr(int(matched, 16))
+    except (ValueError, OverflowError):
+        pass
+
+    return None
+
+
+def _key_codepoint(key):
+    # Returns the codepoint a key stands for, or None if it can never be looked up
+    try:
+        codepoint = int(key, 16)
+    except ValueError:
+        return None
+
+    # Keys like "00A8" can never be looked up, since convert_char formats codepoints without leading zeroes
+    if codepoint > 0x10FFFF or "%X" % codepoint != key:
+        return None
+    return codepoint
+
+
+def compile_paths(mappings):
+    # Returns the path (see _resolve()) of every key in the mappings that can be looked up
+    keys = {}  # Used as an ordered set
+    for mapping in mappings:
+        keys.update(dict.fromkeys(mapping))
+
+    return {
+        key: _resolve(key, mappings) for key in keys if _key_codepoint(key) is not None
+    }
+
+
+def extend_paths(paths, mapping):
+    # Follows paths (from compile_paths()) through one more mapping, applied after the ones they were resolved from.
+    # Only the keys whose path ends at one of the mapping's keys, and its own new keys, are touched.
+    # Returns the extended paths, and the keys that were touched
+    ends = {}
+    for key, path in paths.items():
+        if type(path[-1]) is str:
+            ends.setdefault(path[-1], []).append(key)
+
+    paths = dict(paths)
+    touched = []
+    for end in mapping:
+        for key in ends.get(end, []):
+            paths[key] = path = list(paths[key])
+            _follow(path, mapping)
+            touched.append(key)
+
+        # Keys seen for the first time weren't in any earlier mapping, so their walk starts here
+        if end not in paths and _key_codepoint(end) is not None:
+            paths[end] = path = [end]
+            _follow(path, mapping)
+            touched.append(end)
+
+    return paths, touched
+
+
+def compile_path(key, path):
+    # Returns what the key converts to following path, or None if it isn't converted,
+    # and the distinct outputs along the way (e.g. EC77 -> 4CA4 -> 9FD0)
+    char = chr(int(key, 16))
+    output = _format_output(path[-1])
+    if output is None or output == char:
+        return None, None
+
+    hops = [char]
+    for matched in path[1:]:
+        formatted = _format_output(matched)
+        if formatted is not None and formatted != hops[-1]:
+            hops.append(formatted)
+    return output, tuple(hops)
+
+
+def compile_table(mappings, paths=None):
+    # Flatten the mappings into a single table of codepoint (int) -> final output (str),
+    # so that converting a character is one lookup instead of one per mapping.
+    # Also returns the chains that took more than one hop to resolve, as tuples of the
+    # distinct outputs along the way (e.g. EC77 -> 4CA4 -> 9FD0).
+    # paths can be given instead of mappings, if they were already resolved
+    table = {}
+    chains = {}
+
+    if paths is None:
+        paths = compile_paths(mappings)
+
+    for key, path in paths.items():
+        output, hops = compile_path(key, path)
+        if output is None:
+            continue
+
+        codepoint = int(key, 16)
+        table[codepoint] = output
+        if len(hops) > 2:
+            chains[codepoint] = hops
+
+    return table, chains
+
+
+def pack_table(table, chains):
+    # Returns the table and chains in the form they are stored in as JSON
+    keys = sorted(table)
+    return {
+        "keys": keys,
+        "values": [table[key] for key in keys],
+        "chains": [list(chains[key]) for key in sorted(chains)],
+    }
+
+
+def unpack_table(packed):
+    # The inverse of pack_table()
+    table = dict(zip(packed["keys"], packed["values"]))
+    chains = {ord(hops[0]): tuple(hops) for hops in packed["chains"]}
+    return table, chains
+
+
+# The artifact written by `python -m hkscs_unicode_converter.build` holds the output of compile_table(),
+# so the data files don't need to be parsed at runtime
+ARTIFACT_NAME = "compiled.json"
+ARTIFACT_FORMAT = 1
+
+
+def read_artifact(config_hash):
+    # Returns the table and chains stored in the artifact,
+    # or None if there isn't one or it was built from a different config.json
+    try:
+        with pkg_resources.open_text(data, ARTIFACT_NAME) as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        _logger.info("Ignoring %s with unknown format", ARTIFACT_NAME)
+        return None
+    if artifact.get("config") != config_hash:
+        _logger.info("Ignoring %s built from a different config.json", ARTIFACT_NAME)
+        return None
+
+    return unpack_table(artifact)
+
+
+# The build also writes the path of every key through the mappings (see compile_paths()) to this file,
+# keyed by the data_hash() of config.json and the data files. When the bundled mappings are compiled along with
+# overlays, only the overlays' data files need parsing, since their mappings can be followed from the stored paths.
+PATHS_NAME = "paths.json"
+
+
+def unpack_paths(artifact):
+    # Returns the paths stored in a paths artifact.
+    # Tuples (for sequences like <00CA,0304>) are stored as lists
+    paths = {}
+    for path in artifact["paths"]:
+        paths[path[0]] = [
+            tuple(matched) if type(matched) is list else matched for matched in path
+        ]
+    return paths
+
+
+def read_paths_artifact(key):
+    # Returns the paths stored in the packaged paths artifact,
+    # or None if there isn't one or it was built from different data files than the ones key is the data_hash() of
+    try:
+        with pkg_resources.open_text(data, PATHS_NAME) as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if artifact.get("format") != ARTIFACT_FORMAT or artifact.get("data") != key:
+        return None
+    return unpack_paths(artifact)
+
+
+# When there is no usable artifact (e.g. config.json has been customized), the table compiled from the data files
+# is cached in the user's cache directory, keyed by a hash of config.json and every data file it lists,
+# so that only the first process to start after a change needs to parse them.
+# Set HKSCS_UNICODE_CONVERTER_CACHE to use a different directory, or to an empty string to disable the cache.
+CACHE_VARIABLE = "HKSCS_UNICODE_CONVERTER_CACHE"
+
+
+def cache_directory():
+    # Returns the directory compiled tables are cached in, or None if the cache is disabled
+    directory = os.environ.get(CACHE_VARIABLE)
+    if directory is not None:
+        return directory or None
+
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "hkscs-unicode-converter")
+
+
+# Bump this if a change to the parsers or to compile_table() changes what the same data files compile to,
+# so that tables cached by earlier versions of the package aren't used
+COMPILER_VERSION = 1
+
+
+def data_hash(config, files, data_dir=None):
+    # Returns a hash of config.json and the contents of every data file listed in it,
+    # including the files that deltas are based on, and of the version of the compiler
+    digest = hashlib.sha256()
+    digest.update(b"%d\0" % COMPILER_VERSION)
+    digest.update(b"%d\0" % len(config))
+    digest.update(config)
+    for file in files:
+        for name in _data_names(data_file_name(file), data_dir):
+            contents = _read_data(name, data_dir)
+            digest.update(b"%s\0%d\0" % (name.encode("utf-8"), len(contents)))
+            digest.update(contents)
+    return digest.hexdigest()
+
+
+def _cache_path(directory, key):
+    return os.path.join(directory, f"{key}.json")
+
+
+def read_cache(directory, key):
+    # Returns the table and chains cached under key, or None if they can't be read
+    try:
+        with open(_cache_path(directory, key), encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("format") != ARTIFACT_FORMAT or cached.get("key") != key:
+            return None
+        return unpack_table(cached)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        _logger.info("Ignoring unreadable cached table %s: %s", key, e)
+        return None
+
+
+def write_cache(directory, key, table, chains):
+    # Writes to a temporary file first and then renames it into place,
+    # so that other processes never see a partially written file.
+    # Failing to write the cache isn't an error, since the table can always be compiled again.
+    cached = {"format": ARTIFACT_FORMAT, "key": key, **pack_table(table, chains)}
+    temporary = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+        ) as f:
+            temporary = f.name
+            json.dump(cached, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporary, _cache_path(directory, key))
+    except OSError as e:
+        _logger.info("Couldn't cache the compiled table in %s: %s", directory, e)
+        if temporary is not None:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+
+def _compile_cached(sources):
+    # Returns the table and chains compiled from sources, a list of (config, files, data_dir)
+    # whose mappings are applied in order, through the cache if it's enabled.
+    # The files may be a selection of the ones in config (e.g. up to a revision), which changes the key.
+    directory = cache_directory()
+    key = first = data_hash(*sources[0])
+    if len(sources) > 1:
+        hashes = [first] + [data_hash(*source) for source in sources[1:]]
+        key = hashlib.sha256(" ".join(hashes).encode("ascii")).hexdigest()
+
+    compiled = read_cache(directory, key) if directory else None
+    if compiled is None:
+        # If the first source is the bundled data (e.g. with overlays on top), its paths are already stored,
+        # and only the other sources' data files are parsed
+        paths = read_paths_artifact(first)
+        if paths is None:
+            mappings = []
+            for _, files, data_dir in sources:
+                mappings += load_shared_mappings(files, data_dir)
+            compiled = compile_table(mappings)
+        else:
+            for _, files, data_dir in sources[1:]:
+                for mapping in load_shared_mappings(files, data_dir):
+                    paths, _ = extend_paths(paths, mapping)
+            compiled = compile_table(None, paths)
+        if directory:
+            write_cache(directory, key, *compiled)
+    return compiled
+
+
+def load_compiled(config):
+    # Returns the files listed in config (the contents of config.json), and the table and chains compiled from them
+    files = json.loads(config)
+    compiled = read_artifact(hashlib.sha256(config).hexdigest())
+    if compiled is None:
+        compiled = _compile_cached([(config, files, None)])
+    return (files, *compiled)
+
+
+def load_overlay(path):
+    # An overlay is a JSON file listing extra data files in the same shape as config.json,
+    # whose mappings are applied after the ones in config.json.
+    # Its data files are read from the directory the overlay is in.
+    # Returns the raw contents of the overlay, the files listed in it, and that directory
+    with open(path, "rb") as f:
+        config = f.read()
+    return config, json.loads(config), os.path.dirname(os.path.abspath(path))
+
+
+def load_data_dir(data_dir=None, overlays=(), revision=None, names=None):
+    # Returns the files listed in data_dir's config.json and in each overlay (a path to an overlay file),
+    # and the table and chains compiled from all of them into one.
+    # If revision is given, files added after that revision of the standard are left out.
+    # If names is given, only the files in config.json with those names are used.
+    # Unlike load_compiled(), the packaged artifact is never used,
+    # since the data files may have changed without config.json changing.
+    config, files = load_config(data_dir)
+    if names is not None:
+        files = filter_names(files, names)
+    sources = [(config, files, data_dir)]
+    sources += [load_overlay(path) for path in overlays]
+    if revision is not None:
+        sources = [
+            (config, filter_revision(files, revision), data_dir)
+            for config, files, data_dir in sources
+        ]
+    files = [file for _, source_files, _ in sources for file in source_files]
+    return (files, *_compile_cached(sources))
@@ -0,0 +1,283 @@
+# The lookup tables used for conversions, and loading them from the quickest source available
+import hashlib
+import importlib
+import logging
+import marshal
+import os
+import re
+from types import MappingProxyType
+
+from . import data
+from .converter import _PUA_END, _PUA_START
+
+_logger = logging.getLogger(__name__)
+
+# The module written by `python3 -m hkscs_unicode_converter.build --target python`,
+# which is loaded from its cached bytecode without importing csv or json or parsing any text
+GENERATED_MODULE = "_compiled"
+GENERATED_FORMAT = 2
+
+# The file written by `python3 -m hkscs_unicode_converter.build --target blob`, holding the same constants
+# as the generated module in a single marshalled dict. It's read with the package's loader, so inside a zipapp
+# or a zipped package it's read straight from the archive, without compiling any source or opening the data files.
+BLOB_NAME = "compiled.blob"
+
+# Bump this if the way fingerprint_table() encodes the table changes
+FINGERPRINT_VERSION = 1
+
+
+# Every character in the PUA, shared by all of the tables instead of each creating their own
+_PUA_CHARS = tuple([chr(codepoint) for codepoint in range(_PUA_START, _PUA_END + 1)])
+
+
+def _char(codepoint):
+    if _PUA_START <= codepoint <= _PUA_END:
+        return _PUA_CHARS[codepoint - _PUA_START]
+    return chr(codepoint)
+
+
+def build_pua_table(table):
+    # Returns a tuple with the output for each codepoint in the PUA (the character itself if unchanged),
+    # and a dict of char -> output for the few keys outside of the PUA
+    pua_table = list(_PUA_CHARS)
+    fallback = {}
+
+    for codepoint, output in table.items():
+        if _PUA_START <= codepoint <= _PUA_END:
+            pua_table[codepoint - _PUA_START] = output
+        else:
+            fallback[chr(codepoint)] = output
+
+    return tuple(pua_table), fallback
+
+
+def compile_pattern(table):
+    # Build a character class matching every key in the table, merging consecutive codepoints into ranges
+    ranges = []
+    for codepoint in sorted(table):
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+
+    if not ranges:
+        return re.compile("(?!)")  # Never matches
+
+    def escape(codepoint):
+        return "\\u%04X" % codepoint if codepoint <= 0xFFFF else "\\U%08X" % codepoint
+
+    return re.compile(
+        "[%s]"
+        % "".join(
+            [
+                (
+                    escape(start)
+                    if start == end
+                    else "%s-%s" % (escape(start), escape(end))
+                )
+                for start, end in ranges
+            ]
+        )
+    )
+
+
+def share_outputs(table, base):
+    # Replaces each output in table (codepoint -> output) with the equal one in base, if there is one,
+    # so that tables compiled from the same data files keep one copy of each output between them
+    for codepoint, output in table.items():
+        shared = base.get(codepoint)
+        if shared == output:
+            table[codepoint] = shared
+    return table
+
+
+def fingerprint_table(table):
+    # Returns a hash of what each codepoint converts to, which doesn't depend on
+    # how the table was loaded or on the data files beyond the conversions they produce
+    digest = hashlib.sha256(b"hkscs-unicode-converter %d\n" % FINGERPRINT_VERSION)
+    for codepoint in sorted(table):
+        output = " ".join(["%X" % ord(char) for char in table[codepoint]])
+        digest.update(b"%X\t%s\n" % (codepoint, output.encode("ascii")))
+    return digest.hexdigest()
+
+
+class Tables:
+    # Everything needed for conversions, built from the compiled table in one go.
+    # If base is given (e.g. the default tables), anything that comes out the same as base's is shared with it
+    def __init__(self, files, translation_table, chains, base=None):
+        self.files = files
+        if base is not None and translation_table == base.translation_table:
+            translation_table = base.translation_table
+
+        # translation_table maps ordinals to their converted str (which may be more than one codepoint),
+        # so it can be passed directly to str.translate(). It's only used internally, since changing it
+        # wouldn't change pua_table; translation_view is a read-only view of it for callers.
+        self.translation_table = translation_table
+        self.translation_view = MappingProxyType(translation_table)
+        self.chains = chains
+        for hops in self.chains.values():
+            _logger.debug(
+                "Flattened %d-hop chain %s",
+                len(hops) - 1,
+                " -> ".join(
+                    ["%X" % ord(hop) if len(hop) == 1 else repr(hop) for hop in hops]
+                ),
+            )
+
+        self.pua_table, self.fallback = build_pua_table(self.translation_table)
+        if base is not None and self.pua_table == base.pua_table:
+            self.pua_table = base.pua_table
+        if base is not None and self.fallback == base.fallback:
+            self.fallback = base.fallback
+
+        if (
+            base is not None
+            and translation_table.keys() == base.translation_table.keys()
+        ):
+            self.convertible = base.convertible
+            self.min_convertible = base.min_convertible
+            self.pattern = base.pattern
+        else:
+            # Every character that converts to something else, and the lowest of them,
+            # so strings with nothing to convert can be recognized without building a new string
+            self.convertible = frozenset(
+                [_char(codepoint) for codepoint in self.translation_table]
+            )
+            self.min_convertible = min(self.convertible, default=chr(0x10FFFF))
+
+            # pattern matches a single character that would be converted, e.g. for use with finditer()
+            self.pattern = compile_pattern(self.translation_table)
+
+        translation_table = self.translation_table
+
+        def replace_match(match):
+            return translation_table[ord(match.group())]
+
+        self.replace_match = replace_match
+
+        self._fingerprint = None
+        self._bmp = None
+
+        # For tables built by bmp(), the mappings to astral codepoints that were left out
+        self.astral = {}
+
+    @property
+    def bmp(self):
+        # The same tables without any mapping whose output is outside the BMP (e.g. in CJK Extension B),
+        # for targets like MySQL's utf8mb3 that only accept BMP characters. Built on first use
+        if self._bmp is None:
+            table = {}
+            astral = {}
+            for codepoint, output in self.translation_table.items():
+                if max(output) <= "\uffff":
+                    table[codepoint] = output
+                else:
+                    astral[codepoint] = output
+
+            chains = {
+                codepoint: hops
+                for codepoint, hops in self.chains.items()
+                if codepoint in table
+            }
+            bmp = Tables(self.files, table, chains)
+            bmp.astral = astral
+            _logger.info(
+                "BMP-only tables skip %d mappings to astral codepoints", len(astral)
+            )
+            self._bmp = bmp
+
+        return self._bmp
+
+    @property
+    def fingerprint(self):
+        # Computed on first use, since most callers never need it
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint_table(self.translation_table)
+        return self._fingerprint
+
+
+def read_config():
+    # Read through the package's loader, which also works from a zip file,
+    # since importlib.resources is slow to import
+    path = os.path.join(os.path.dirname(data.__file__), "config.json")
+    return data.__loader__.get_data(path)
+
+
+def _load_constants(name, constants, config):
+    # Returns the tables stored in the constants of a generated module or blob,
+    # or None if they were built from a different config.json
+    if constants.get("FORMAT") != GENERATED_FORMAT:
+        _logger.info("Ignoring %s with unknown format", name)
+        return None
+    if constants["CONFIG"] != config:
+        _logger.info("Ignoring %s built from a different config.json", name)
+        return None
+
+    table = dict(zip(constants["KEYS"], constants["VALUES"]))
+    chains = {ord(hops[0]): hops for hops in constants["CHAINS"]}
+    return Tables(constants["FILES"], table, chains)
+
+
+def load_generated(module, config):
+    # Returns the tables stored in a generated module, or None if it was built from a different config.json
+    return _load_constants(module.__name__, vars(module), config)
+
+
+def load_blob(contents, config):
+    # Returns the tables stored in the contents of a blob, or None if it can't be used
+    try:
+        constants = marshal.loads(contents)
+    except (EOFError, ValueError, TypeError):
+        # e.g. written by a version of Python with a newer marshal format
+        _logger.info("Ignoring %s that can't be unmarshalled", BLOB_NAME)
+        return None
+
+    if not isinstance(constants, dict):
+        _logger.info("Ignoring %s with unknown format", BLOB_NAME)
+        return None
+    return _load_constants(BLOB_NAME, constants, config)
+
+
+def read_blob(config):
+    # Returns the tables stored in the package's blob, or None if there isn't a usable one
+    path = os.path.join(os.path.dirname(data.__file__), BLOB_NAME)
+    try:
+        contents = data.__loader__.get_data(path)
+    except OSError:
+        return None
+    return load_blob(contents, config)
+
+
+def load_tables():
+    config = read_config()
+
+    try:
+        module = importlib.import_module(f".{GENERATED_MODULE}", data.__name__)
+    except ImportError:
+        pass
+    else:
+        tables = load_generated(module, config)
+        if tables is not None:
+            return tables
+
+    tables = read_blob(config)
+    if tables is not None:
+        return tables
+
+    # Only import what's needed to parse the data if there's no usable generated module
+    from . import _loader
+
+    return Tables(*_loader.load_compiled(config))
+
+
+def reload_tables(data_dir=None, overlays=(), revision=None, names=None, base=None):
+    # Returns tables compiled from the config.json and data files in data_dir
+    # (or in the package's data directory if data_dir is None), followed by each overlay,
+    # leaving out anything added after revision if it's given, and the files in config.json not in names if it's given.
+    # If base is given, the new tables share the outputs they have in common with it, and anything else that is the same.
+    from . import _loader
+
+    files, table, chains = _loader.load_data_dir(data_dir, overlays, revision, names)
+    if base is not None:
+        share_outputs(table, base.translation_table)
+    return Tables(files, table, chains, base)
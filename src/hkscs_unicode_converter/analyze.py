@@ -0,0 +1,251 @@
+# Reports what the mapping data does that the compiled tables have to get right, as JSON:
+#   $ python3 -m hkscs_unicode_converter.analyze --output analysis.json
+# Run it after changing anything in the data directory, and compare the report with the previous one.
+#
+# The data files listed in config.json are walked in order, the same way the tables are compiled
+# (see _loader._resolve()), and the report lists:
+# - chains: keys that are remapped more than once on the way to their output, e.g. EC77 -> 4CA4 -> 9FD0
+# - conflicts: keys that more than one data file maps to different outputs
+# - cycles: codepoints that are mapped back to themselves through the data files, e.g. 4CA4 -> 9FD0 -> 4CA4
+# - reconverted: outputs that are themselves converted, so converting a string twice changes it again
+# - unreachable: entries that are never looked up, because an earlier data file already remapped their key
+#   to something else, the walk stopped at a sequence like <00CA,0304> in an earlier data file, or their key can't be looked up
+import argparse
+import json
+import sys
+
+from . import _loader
+
+
+def _entry_output(value):
+    # Returns what a value in a mapping converts to (see _loader._format_output()), or None
+    return _loader._format_output(value if len(value) > 1 else value[0])
+
+
+def _walk(key, mappings):
+    # Follows key through the mappings like _loader._resolve(), and also returns the value that was looked up
+    # in each mapping (None once the walk stopped at a sequence), and the indexes of the mappings that remapped it
+    path = [key]
+    lookups = []
+    remapped = []
+    for index, mapping in enumerate(mappings):
+        lookups.append(path[-1] if type(path[-1]) is str else None)
+        length = len(path)
+        _loader._follow(path, mapping)
+        if len(path) > length:
+            remapped.append(index)
+
+    return path, lookups, remapped
+
+
+def _strongly_connected(graph):
+    # Returns the strongly connected components of graph (node -> list of nodes) with more than one node,
+    # using an iterative version of Tarjan's algorithm
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+
+        work = [(root, iter(graph.get(root, ())))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        components.append(sorted(component))
+
+    return sorted(components)
+
+
+def analyze(files, mappings):
+    # Returns the report for the mappings loaded from files (see _loader.load_mappings())
+    names = [file["name"] for file in files]
+    paths = _loader.compile_paths(mappings)
+    table, _ = _loader.compile_table(mappings, paths)
+
+    chains = []
+    lookups = {}
+    # The values looked up in each mapping by any walk
+    arrivals = [set() for _ in mappings]
+    for key in paths:
+        path, lookups[key], remapped = _walk(key, mappings)
+        for index, value in enumerate(lookups[key]):
+            arrivals[index].add(value)
+
+        output, hops = _loader.compile_path(key, path)
+        if output is None or len(hops) <= 2:
+            continue
+
+        # The data file that made each of the distinct outputs along the way
+        steps = []
+        previous = hops[0]
+        for index, matched in zip(remapped, path[1:]):
+            formatted = _loader._format_output(matched)
+            if formatted is not None and formatted != previous:
+                steps.append({"file": names[index], "output": formatted})
+                previous = formatted
+        chains.append({"codepoint": key, "output": output, "hops": steps})
+
+    targets = {}
+    edges = []
+    for name, mapping in zip(names, mappings):
+        for key, value in mapping.items():
+            output = _entry_output(value)
+            targets.setdefault(key, []).append({"file": name, "output": output})
+            try:
+                edges.append((name, int(key, 16), output))
+            except ValueError:
+                pass
+
+    conflicts = [
+        {"codepoint": key, "targets": entries}
+        for key, entries in targets.items()
+        if len(set([entry["output"] for entry in entries])) > 1
+    ]
+
+    # Only outputs of a single codepoint can be looked up again
+    graph = {}
+    for _, codepoint, output in edges:
+        if output is not None and len(output) == 1 and ord(output) != codepoint:
+            graph.setdefault(codepoint, []).append(ord(output))
+    cycles = []
+    for component in _strongly_connected(graph):
+        members = set(component)
+        cycles.append(
+            {
+                "codepoints": ["%X" % codepoint for codepoint in component],
+                "edges": [
+                    {"file": name, "codepoint": "%X" % codepoint, "output": output}
+                    for name, codepoint, output in edges
+                    if codepoint in members
+                    and output is not None
+                    and len(output) == 1
+                    and ord(output) in members
+                ],
+            }
+        )
+
+    reconverted = [
+        {
+            "codepoint": "%X" % codepoint,
+            "output": output,
+            "converted": table[ord(output)],
+        }
+        for codepoint, output in sorted(table.items())
+        if len(output) == 1 and ord(output) in table
+    ]
+
+    unreachable = []
+    for index, (name, mapping) in enumerate(zip(names, mappings)):
+        for key, value in mapping.items():
+            if key in arrivals[index]:
+                continue
+
+            output = _entry_output(value)
+            if key not in lookups:
+                reason = "key"
+            elif lookups[key][index] is None:
+                reason = "sequence"
+            elif output == _loader._format_output(lookups[key][index]):
+                # Later revisions repeat most of the rows of earlier ones, which makes no difference
+                continue
+            else:
+                reason = "remapped"
+            unreachable.append(
+                {
+                    "file": name,
+                    "codepoint": key,
+                    "output": output,
+                    "reason": reason,
+                }
+            )
+
+    return {
+        "files": names,
+        "chains": chains,
+        "conflicts": conflicts,
+        "cycles": cycles,
+        "reconverted": reconverted,
+        "unreachable": unreachable,
+    }
+
+
+def analyze_data_dir(data_dir=None):
+    # Returns the report for the config.json and data files in data_dir (by default, the package's data directory)
+    _, files = _loader.load_config(data_dir)
+    return analyze(files, _loader.load_mappings(files, data_dir))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python3 -m hkscs_unicode_converter.analyze",
+        description="Report chains, conflicts, cycles and unreachable entries in the HKSCS mapping data",
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        help="the directory with config.json and the data files (default: the package's data directory)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="where to write the report as JSON (default: standard output)",
+    )
+    args = parser.parse_args(args)
+
+    report = analyze_data_dir(args.data_dir)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=1)
+        print()
+
+    # The report may be written to standard output, so summarize it on standard error
+    print(
+        ", ".join(
+            [
+                f"{len(report[section])} {section}"
+                for section in [
+                    "chains",
+                    "conflicts",
+                    "cycles",
+                    "reconverted",
+                    "unreachable",
+                ]
+            ]
+        ),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# Compiles config.json and the data files it lists into the artifact that converter loads at runtime.
+# Run this after changing anything in the data directory:
+#   $ python3 -m hkscs_unicode_converter.build
+# Use --target python to generate a Python module instead, which loads even faster
+# since it only needs to be unmarshalled from its cached bytecode,
+# --target blob to write the same constants to a single marshalled file, for zipapps and zipped packages
+# (where the module's bytecode isn't cached, so its source would be compiled every time it's imported),
+# or --target binary to write a table for hkscs_unicode_converter.mapped.MappedTable.
+#
+# Use --delta to store a data file as a delta over another one (see _loader.DELTA_SUFFIX), then set "file" to the name
+# of the delta in its entry in config.json.
+#
+# After adding a new entry to the end of config.json (e.g. for a new revision of HKSCS), use --incremental to
+# only parse the new entry's data file, and print which outputs changed:
+#   $ python3 -m hkscs_unicode_converter.build --incremental --diff changes.json
+import argparse
+import difflib
+import hashlib
+import importlib.resources as pkg_resources
+import json
+import marshal
+import os
+import sys
+
+from . import _loader, _lookup, data, mapped
+
+TARGETS = {
+    "json": _loader.ARTIFACT_NAME,
+    "python": f"{_lookup.GENERATED_MODULE}.py",
+    "blob": _lookup.BLOB_NAME,
+    "binary": "compiled.bin",
+}
+
+
+# The json target also writes the path of every key through the mappings to this file, next to the artifact,
+# so that --incremental can follow them through a new mapping without parsing the other data files
+# (see also _loader.read_paths_artifact())
+PATHS_NAME = _loader.PATHS_NAME
+
+
+def _compile_paths():
+    config, files = _loader.load_config()
+    return config, files, _loader.compile_paths(_loader.load_mappings(files))
+
+
+def _compile():
+    config, files, paths = _compile_paths()
+    table, chains = _loader.compile_table(None, paths)
+    return config, files, table, chains
+
+
+def compile_artifact():
+    return _artifact(*_compile())
+
+
+def _sources(files):
+    # Returns the hash of each data file that files are read from (including the bases of deltas), by name
+    sources = {}
+    for file in files:
+        for name in _loader._data_names(_loader.data_file_name(file)):
+            contents = pkg_resources.read_binary(data, name)
+            sources[name] = hashlib.sha256(contents).hexdigest()
+    return sources
+
+
+def _artifact(config, files, table, chains):
+    # Record what the artifact was built from, so a stale artifact can be detected
+    return {
+        "format": _loader.ARTIFACT_FORMAT,
+        "config": hashlib.sha256(config).hexdigest(),
+        "sources": _sources(files),
+        **_loader.pack_table(table, chains),
+    }
+
+
+def write_artifact(artifact, path):
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(",", ":"))
+        f.write("\n")
+
+
+def _key_order(key):
+    return int(key, 16)
+
+
+def _paths_artifact(config, files, paths):
+    return {
+        "format": _loader.ARTIFACT_FORMAT,
+        "config": hashlib.sha256(config).hexdigest(),
+        "data": _loader.data_hash(config, files),
+        "files": files,
+        # Each path is stored as the key followed by what it was mapped to in turn
+        "paths": [
+            [list(matched) if type(matched) is tuple else matched for matched in path]
+            for path in [paths[key] for key in sorted(paths, key=_key_order)]
+        ],
+    }
+
+
+def compile_paths_artifact():
+    return _paths_artifact(*_compile_paths())
+
+
+def read_paths(path):
+    # Returns the files and paths stored in a paths artifact
+    with open(path, encoding="utf-8") as f:
+        artifact = json.load(f)
+    if artifact.get("format") != _loader.ARTIFACT_FORMAT:
+        raise ValueError(f"{path} has unknown format {artifact.get('format')}")
+
+    return artifact["files"], _loader.unpack_paths(artifact)
+
+
+def compile_incremental(files, paths):
+    # Returns what compile_artifact() and compile_paths_artifact() would,
+    # given the files and paths compiled from all but the last entry of config.json,
+    # after only parsing the data file of the last entry.
+    # Also returns a list of the outputs that changed, as dicts of codepoint (hex str) -> before and after
+    # (either of which is None if the codepoint wasn't or isn't converted)
+    config, new_files = _loader.load_config()
+    if new_files[:-1] != files:
+        raise ValueError(
+            "config.json must be the same as the one the paths were compiled from,"
+            " with one entry added to the end"
+        )
+
+    (mapping,) = _loader.load_mappings(new_files[-1:])
+    new_paths, touched = _loader.extend_paths(paths, mapping)
+
+    diff = []
+    for key in sorted(set(touched), key=_key_order):
+        before = _loader.compile_path(key, paths[key])[0] if key in paths else None
+        after = _loader.compile_path(key, new_paths[key])[0]
+        if before != after:
+            diff.append({"codepoint": key, "before": before, "after": after})
+
+    table, chains = _loader.compile_table(None, new_paths)
+    artifact = _artifact(config, new_files, table, chains)
+    return artifact, _paths_artifact(config, new_files, new_paths), diff
+
+
+def _format_tuple(name, items, per_line=8):
+    lines = [f"{name} = ("]
+    for index in range(0, len(items), per_line):
+        line = " ".join([f"{item}," for item in items[index : index + per_line]])
+        lines.append(f"    {line}")
+    lines.append(")")
+    return lines
+
+
+def _constants(compiled=None):
+    # Returns the constants stored in the generated module and the blob,
+    # given the (config, files, table, chains) they're built from (by default, compiled from the data files).
+    # SOURCES is the same as in the json artifact, to check that they were built from the same data files.
+    config, files, table, chains = compiled or _compile()
+    keys = sorted(table)
+    return {
+        "FORMAT": _lookup.GENERATED_FORMAT,
+        "CONFIG": config,
+        "SOURCES": _sources(files),
+        "FILES": files,
+        "KEYS": tuple(keys),
+        "VALUES": tuple([table[key] for key in keys]),
+        "CHAINS": tuple([chains[key] for key in sorted(chains)]),
+    }
+
+
+def generate_module(compiled=None):
+    # Returns the source of a module holding the compiled table as literal constants.
+    # Tuples of constants are stored as-is in the bytecode, so loading it doesn't run any code per entry.
+    constants = _constants(compiled)
+
+    lines = [
+        "# Generated by hkscs_unicode_converter.build, do not edit",
+        f"FORMAT = {constants['FORMAT']}",
+        f"CONFIG = {constants['CONFIG']!r}",
+        f"SOURCES = {constants['SOURCES']!r}",
+        f"FILES = {ascii(constants['FILES'])}",
+    ]
+    lines += _format_tuple("KEYS", [str(key) for key in constants["KEYS"]])
+    lines += _format_tuple("VALUES", [ascii(value) for value in constants["VALUES"]])
+    lines += _format_tuple("CHAINS", [ascii(hops) for hops in constants["CHAINS"]], 1)
+    return "\n".join(lines) + "\n"
+
+
+def generate_blob(compiled=None):
+    # Returns the contents of a blob holding the same constants as generate_module(), in one marshalled dict.
+    # Unmarshalling doesn't depend on where the blob was read from, so it loads as quickly from a zip file.
+    return marshal.dumps(_constants(compiled))
+
+
+def write_blob(contents, path):
+    with open(path, "wb") as f:
+        f.write(contents)
+
+
+def write_binary(contents, path):
+    # Worker processes may have the old file mapped (see mapped.MappedTable), and truncating it in place would make
+    # them fail with SIGBUS when they read past its new end. Write a new file next to it and rename it into place
+    # instead, so they keep the old contents until they open the file again.
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(contents)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def update_generated(directory, compiled):
+    # The generated module and the blob take precedence over the json artifact,
+    # so rebuilding the json artifact also rebuilds any of them in the same directory from compiled
+    # (config, files, table, chains), instead of leaving them behind with the old data.
+    # Returns the paths that were rebuilt
+    updated = []
+    module = os.path.join(directory, TARGETS["python"])
+    if os.path.exists(module):
+        write_module(generate_module(compiled), module)
+        updated.append(module)
+    blob = os.path.join(directory, TARGETS["blob"])
+    if os.path.exists(blob):
+        write_blob(generate_blob(compiled), blob)
+        updated.append(blob)
+    return updated
+
+
+def write_module(source, path):
+    with open(path, "w", encoding="ascii", newline="\n") as f:
+        f.write(source)
+
+
+def encode_delta(base_name, base, lines):
+    # Returns the contents of a delta file (see _loader.DELTA_SUFFIX) encoding lines over base,
+    # where both are lists of lines with their line endings, and base is read from base_name
+    operations = [f"{_loader.DELTA_HEADER}{base_name}\n"]
+    matcher = difflib.SequenceMatcher(None, base, lines, autojunk=False)
+    for tag, base_start, base_end, start, end in matcher.get_opcodes():
+        if tag == "equal":
+            operations.append(f"={base_end - base_start}\n")
+            continue
+        if base_end > base_start:
+            operations.append(f"-{base_end - base_start}\n")
+        operations += [f"+{line}" for line in lines[start:end]]
+
+    # Lines of the base file left at the end are skipped anyway,
+    # and the last line of lines may not end with a newline
+    while operations[-1].startswith("-"):
+        operations.pop()
+    return "".join(operations)
+
+
+def write_delta(base_path, path):
+    # Writes path as a delta over base_path (which may be a delta itself) to path + DELTA_SUFFIX,
+    # and returns where it was written
+    base_name = os.path.basename(base_path)
+    with _loader._open_data(base_name, os.path.dirname(base_path)) as f:
+        base = list(f)
+    with open(path, encoding="utf-8", newline="") as f:
+        lines = f.read().splitlines(keepends=True)
+
+    output = path + _loader.DELTA_SUFFIX
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        f.write(encode_delta(base_name, base, lines))
+    return output
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python3 -m hkscs_unicode_converter.build",
+        description="Compile the HKSCS mapping data into a single artifact",
+    )
+    parser.add_argument(
+        "-t",
+        "--target",
+        choices=sorted(TARGETS),
+        default="json",
+        help="what to compile the data into (default: json)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="where to write the artifact (default: the package's data directory)",
+    )
+    parser.add_argument(
+        "--delta",
+        nargs=2,
+        metavar=("BASE", "FILE"),
+        help="instead of compiling anything, write FILE as a delta over BASE (in the same directory)"
+        " to FILE.delta, for storing data files that are nearly identical to another one",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only parse the data file of the entry added to the end of config.json"
+        " since the json artifact was built",
+    )
+    parser.add_argument(
+        "--diff",
+        help="with --incremental, where to write the outputs that changed as JSON"
+        " (default: standard output)",
+    )
+    args = parser.parse_args(args)
+
+    output = args.output or os.path.join(
+        os.path.dirname(data.__file__), TARGETS[args.target]
+    )
+    if args.delta:
+        print(f"Wrote delta to {write_delta(*args.delta)}")
+        return
+
+    paths_output = os.path.join(os.path.dirname(output), PATHS_NAME)
+    if args.incremental:
+        if args.target != "json":
+            parser.error("--incremental only supports the json target")
+        artifact, paths_artifact, diff = compile_incremental(*read_paths(paths_output))
+        write_artifact(artifact, output)
+        write_artifact(paths_artifact, paths_output)
+        config, files = _loader.load_config()
+        compiled = (config, files, *_loader.unpack_table(artifact))
+        for path in update_generated(os.path.dirname(output), compiled):
+            print(f"Rebuilt {path}", file=sys.stderr)
+
+        # The diff may be written to standard output, so report progress on standard error
+        if args.diff:
+            write_artifact(diff, args.diff)
+        else:
+            json.dump(diff, sys.stdout, ensure_ascii=False, indent=1)
+            print()
+        print(f"Wrote {args.target} artifact to {output}", file=sys.stderr)
+        print(f"{len(diff)} outputs changed", file=sys.stderr)
+        return
+
+    if args.target == "python":
+        write_module(generate_module(), output)
+    elif args.target == "blob":
+        write_blob(generate_blob(), output)
+    elif args.target == "binary":
+        write_binary(mapped.pack_table(_compile()[2]), output)
+    else:
+        config, files, paths = _compile_paths()
+        table, chains = _loader.compile_table(None, paths)
+        write_artifact(_artifact(config, files, table, chains), output)
+        write_artifact(_paths_artifact(config, files, paths), paths_output)
+        compiled = (config, files, table, chains)
+        for path in update_generated(os.path.dirname(output), compiled):
+            print(f"Rebuilt {path}")
+    print(f"Wrote {args.target} artifact to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+
+from . import converter
+
+
+class ConversionCache:
+    # A least-recently-used cache of converted strings, for workloads that convert the same strings repeatedly.
+    # The cache is bounded both by number of entries and by the total number of characters in them
+    # (counting both the original and converted strings), and is safe to share between threads.
+    # Entries are dropped whenever fingerprint() changes, e.g. after converter.reload() loads different mappings.
+    # By default strings are converted with converter.convert_string(). Another convert function
+    # (e.g. a Converter's convert_string) must be given with the fingerprint function of the mappings it uses.
+    def __init__(
+        self, max_entries=4096, max_chars=1 << 20, convert=None, fingerprint=None
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries argument must be greater than 0")
+        if max_chars <= 0:
+            raise ValueError("max_chars argument must be greater than 0")
+        if (convert is None) != (fingerprint is None):
+            raise TypeError("convert and fingerprint arguments must be given together")
+
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._default = convert is None
+        self._convert = converter.convert_string if self._default else convert
+        self._fingerprint_function = fingerprint
+        self._fingerprint = None
+        # The module's tables and their fingerprint, which only needs computing again once reload() replaces them
+        self._tables = (None, None)
+
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def chars(self):
+        return self._chars
+
+    @staticmethod
+    def _size(string, result):
+        # Unchanged strings are returned as the same object, so they are only counted once
+        return len(string) if result is string else len(string) + len(result)
+
+    def convert_string(self, string):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+
+        tables, fingerprint = self._tables
+        if not self._default:
+            fingerprint = self._fingerprint_function()
+        elif tables is None or tables is not converter._tables:
+            tables = converter._get_tables()
+            fingerprint = tables.fingerprint
+            self._tables = (tables, fingerprint)
+
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._clear_entries()
+                self._fingerprint = fingerprint
+
+            result = self._entries.get(string)
+            if result is not None:
+                self._entries.move_to_end(string)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        # Convert without holding the lock, so other threads aren't blocked on long strings
+        result = self._convert(string)
+        size = self._size(string, result)
+        if size > self.max_chars:
+            return result
+
+        with self._lock:
+            if string in self._entries:  # Another thread got here first
+                return result
+            # Don't keep results converted with mappings that have been replaced since
+            if fingerprint != self._fingerprint:
+                return result
+
+            self._entries[string] = result
+            self._chars += size
+            while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                key, value = self._entries.popitem(last=False)
+                self._chars -= self._size(key, value)
+                self.evictions += 1
+
+        return result
+
+    def _clear_entries(self):
+        self._entries.clear()
+        self._chars = 0
+
+    def clear(self):
+        # Removes every entry and resets the statistics
+        with self._lock:
+            self._clear_entries()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
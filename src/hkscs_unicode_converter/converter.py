@@ -1,135 +1,523 @@
-import csv
-import importlib.resources as pkg_resources
-import json
+import threading
+from array import array
+
+# Almost every key is in the BMP Private Use Area, so convert_char indexes
+# into a dense table covering it instead of hashing the codepoint
+_PUA_START = 0xE000
+_PUA_END = 0xF8FF
+
+
+def _load_tables():
+    # Imported here, so that importing converter doesn't import everything needed to load the data
+    from . import _lookup
+
+    return _lookup.load_tables()
+
+
+# The mapping data is only loaded when it is first needed, since loading it takes a while
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def _get_tables():
+    global _tables
+
+    # Only take the lock if the data hasn't been loaded yet,
+    # and check again once it's held in case another thread loaded it in the meantime
+    tables = _tables
+    if tables is None:
+        with _tables_lock:
+            if _tables is None:
+                _tables = _load_tables()
+            tables = _tables
 
-from . import data
+    return tables
 
-with pkg_resources.open_text(data, "config.json") as config:
-    _files = json.load(config)
 
+# Tables that stop at an earlier revision of the standard (e.g. 2004 for HKSCS-2004), for the revision argument
+# of the conversion functions. Each revision is compiled the first time it's used, from the same data as _tables.
+_revision_tables = {}
+_revision_lock = threading.Lock()
+_source = (None, [])  # The data_dir and overlays passed to the last reload()
 
-def _format_key_value_pair(key, value):
-    if (not key or not value) or (key == value):
-        return (None, None)
 
-    # Strip off "U+" from the start of the keys and values
-    if key.startswith("U+"):
-        key = key[2:]
-    if value.startswith("U+"):
-        value = value[2:]
+def _revision_cutoff(revision):
+    # Returns the latest revision in config.json at or before revision, since the tables only change at those
+    # (e.g. 2005 converts the same as 2004), or None if that's the latest one, which the default tables already are
+    if not isinstance(revision, int):
+        raise TypeError("revision argument must be int type")
 
-    values = tuple([value])
+    revisions = sorted(
+        set([file["revision"] for file in _get_tables().files if "revision" in file])
+    )
+    earlier = [cutoff for cutoff in revisions if cutoff <= revision]
+    if revisions and not earlier:
+        raise ValueError(f"revision must be at least {revisions[0]}")
+    if not earlier or earlier[-1] == revisions[-1]:
+        return None
+    return earlier[-1]
+
+
+def _get_revision_tables(revision):
+    tables = _revision_tables.get(revision)
+    if tables is None:
+        with _revision_lock:
+            tables = _revision_tables.get(revision)
+            if tables is None:
+                cutoff = _revision_cutoff(revision)
+                if cutoff is None:
+                    tables = _get_tables()
+                else:
+                    tables = _revision_tables.get(cutoff)
+                if tables is None:
+                    from . import _lookup
+
+                    # Outputs shared with the default tables are only kept once
+                    tables = _lookup.reload_tables(*_source, cutoff, base=_get_tables())
+                    _revision_tables[cutoff] = tables
+                _revision_tables[revision] = tables
+
+    return tables
+
+
+# Tables for each configuration of Converter that needs its own,
+# keyed by the names of the files in config.json (None for all of them), the revision and the extra overlays
+_configured_tables = {}
+
+
+def _get_configured_tables(files, revision, overlays):
+    # The same configuration is only compiled once, and shared by every Converter with it
+    if files is None and not overlays:
+        return _tables_for(revision)
+
+    key = (files, revision, overlays)
+    tables = _configured_tables.get(key)
+    if tables is None:
+        with _revision_lock:
+            tables = _configured_tables.get(key)
+            if tables is None:
+                if revision is not None:
+                    revision = _revision_cutoff(revision)
+                tables = _configured_tables.get((files, revision, overlays))
+            if tables is None:
+                from . import _lookup
+
+                data_dir, source_overlays = _source
+                tables = _lookup.reload_tables(
+                    data_dir,
+                    [*source_overlays, *overlays],
+                    revision,
+                    files,
+                    base=_get_tables(),
+                )
+                _configured_tables[files, revision, overlays] = tables
+            _configured_tables[key] = tables
+
+    return tables
+
+
+def warmup(*revisions):
+    # Load the mapping data now, instead of on the first conversion,
+    # along with the tables for each of revisions
+    _get_tables()
+    for revision in revisions:
+        _get_revision_tables(revision)
+
+
+# Held while building tables for reload(), so that concurrent reloads are applied one at a time
+_reload_lock = threading.Lock()
+
+
+def _reload(data_dir, overlays):
+    global _tables, _revision_tables, _configured_tables, _source
+
+    from . import _lookup
+
+    with _reload_lock:
+        # The new tables are fully built before they are swapped in.
+        # Conversions that are already running keep using the tables they started with.
+        tables = _lookup.reload_tables(data_dir, overlays)
+        with _tables_lock:
+            _tables = tables
+
+        # Tables for other revisions and configurations are compiled again from the new data when they're next used
+        with _revision_lock:
+            _source = (data_dir, overlays)
+            _revision_tables = {}
+            _configured_tables = {}
+
+
+def reload(data_dir=None, background=False, overlays=()):
+    # Rebuild the tables from the config.json and data files in data_dir (by default, the package's data directory),
+    # then replace the tables in use with them without blocking conversions in the meantime.
+    # overlays is a list of paths to JSON files shaped like config.json, listing extra data files (relative to the overlay)
+    # whose mappings are applied after the ones in config.json, and compiled into the same tables.
+    # With background=True, the tables are built in a new thread, which is returned so that it can be joined.
+    if isinstance(overlays, str):
+        raise TypeError("overlays argument must be an iterable of paths, not str")
+
+    overlays = list(overlays)
+    if not background:
+        _reload(data_dir, overlays)
+        return None
+
+    thread = threading.Thread(
+        target=_reload,
+        args=(data_dir, overlays),
+        name="hkscs-unicode-converter-reload",
+    )
+    thread.daemon = True
+    thread.start()
+    return thread
 
-    # Special case for Ê̄, Ê̌, ê̄, ê̌ (<00CA,0304>, <00CA,030C>, <00EA,0304>, <00EA,030C>)
-    # Strip the "<" and ">" characters, then put each codepoint in the list
-    if value.startswith("<") and value.endswith(">"):
-        value = value[1:-1]
-        values = tuple(value.split(","))
 
-    return (key, values)
+def _tables_for(revision, bmp_only=False):
+    if revision is None:
+        tables = _tables or _get_tables()
+    else:
+        tables = _get_revision_tables(revision)
+    return tables.bmp if bmp_only else tables
 
 
-def _create_mapping(items, columns_from, column_to):
-    # Each key in this mapping should be a single codepoint, represented as all-caps hexadecimal string with no prefix
-    # Each value should be a list of corresponding codepoints (represented the same way as the keys)
-    mapping = {}
+def astral_skipped(revision=None):
+    # Returns how many mappings bmp_only=True leaves out, because they convert to characters outside the BMP
+    return len(_tables_for(revision, bmp_only=True).astral)
+
+
+def _astral_replacer(tables, on_astral):
+    # Returns a function for re.sub() over tables.pattern that converts like tables.bmp,
+    # except that characters converting outside the BMP are replaced with on_astral(char, output)
+    translation_table = tables.translation_table
+    bmp_table = tables.bmp.translation_table
+
+    def replace_match(match):
+        char = match.group()
+        output = bmp_table.get(ord(char))
+        if output is None:
+            return on_astral(char, translation_table[ord(char)])
+        return output
 
-    for item in items:
-        for column_from in columns_from:
-            key, value = _format_key_value_pair(item[column_from], item[column_to])
-            if key and value:
-                mapping[key] = value
+    return replace_match
 
-    return mapping
 
+def fingerprint(revision=None, bmp_only=False):
+    # Returns a hex str identifying the mappings in use, which only changes when some character would convert differently
+    # (not when the package is upgraded without changing any conversions).
+    # Store it alongside converted text to find the text that needs converting again after the mappings change.
+    return _tables_for(revision, bmp_only).fingerprint
 
-def _process_tsv(stream):
-    items = []
 
-    reader = csv.reader(stream, delimiter="\t")
-    headers = next(reader)  # First line contains header titles
+# Module attributes that are loaded on first access
+_LAZY_ATTRIBUTES = {
+    "translation_table": "translation_view",
+    "pattern": "pattern",
+    "_files": "files",
+    "_chains": "chains",
+}
 
-    for row in reader:
-        item = {}
-        for index, value in enumerate(row):
-            if index >= len(headers):
-                break
-            item[headers[index]] = value
-        items.append(item)
 
-    return items
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(_get_tables(), _LAZY_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-_mappings = []
-# Start parsing the data files
-for file in _files:
-    # Each of the _process methods should return a list of dicts
-    # Each dict represents a row; each key in the dict is the column name
-    with pkg_resources.open_text(data, f'{file["name"]}.{file["type"]}') as f:
-        if file["type"] == "tsv":
-            items = _process_tsv(f)
-        else:
-            items = json.load(f)
-
-    # There might be multiple columns that we are interested in converting FROM
-    # (e.g. in HKSCS2004,
-    #  we want both ISO/IEC_10646-1:2000 -> ISO/IEC_10646:2003_Amendment AND
-    #  ISO/IEC_10646-1:1993 -> ISO/IEC_10646:2003_Amendment)
-    columns_from = file["config"]["column_from_keys"]
-    column_to = file["config"]["column_key_to"]
-
-    _mappings.append(_create_mapping(items, columns_from, column_to))
-
-
-def convert_char(char):
+def _check_char(char):
     if not isinstance(char, str):
         raise TypeError("char argument must be str type")
 
-    if len(char) > 1 or len(char) <= 0:
+    if len(char) != 1:
         raise ValueError("char argument must be exactly length 1")
 
-    # Get the hex version of the codepoint for this char, without the "0x" prefix
-    original_codepoint = "%X" % ord(char)
-
-    # Find the matching codepoints from the loaded data files
-    # Must loop through each of the files, because a codepoint may be remapped twice
-    # e.g. EC77 (GCCS) -> 4CA4 (HKSCS-1999) -> 9FD0 (HKSCS-2016)
-    matched = original_codepoint
-    for mapping in _mappings:
-        if matched in mapping:
-            matched = mapping[matched]
-            if len(matched) > 1:  # This should only occur for the <00CA,0304> edgecases
-                break
-            else:
-                matched = matched[0]
 
+def _convert_astral(tables, string, on_astral):
+    # Converts like tables.bmp, replacing characters that convert outside the BMP with on_astral(char, output)
+    return tables.pattern.sub(_astral_replacer(tables, on_astral), string)
+
+
+def _convert_char(tables, char):
+    # Every remap chain was already followed when the tables were built,
+    # so the final output is a single lookup away.
     # Leave the character unchanged if no corresponding codepoints are found
-    if not matched or matched == original_codepoint:
-        return char
-
-    # At this point, there are three possibilities:
-    # - matched is a tuple length 2, for sequences like <00CA,0304>
-    # - matched is a str length 1 and contains a Unicode literal, e.g. "亠"
-    # - matched is a str length > 1, and contains a Unicode codepoint e.g. "39FB"
-    if type(matched) is tuple and len(matched) > 1:
-        try:
-            return "".join([chr(int(codepoint, 16)) for codepoint in matched])
-        except:
-            return char
-    elif type(matched) is str and len(matched) == 1:
-        return matched
-    elif type(matched) is str and len(matched) > 1:
-        try:
-            return chr(int(matched, 16))
-        except:
-            return char
-
-    # Last resort: give up and return the original character
-    return char
-
-
-def convert_string(string):
+    codepoint = ord(char)
+    if _PUA_START <= codepoint <= _PUA_END:
+        return tables.pua_table[codepoint - _PUA_START]
+    return tables.fallback.get(char, char)
+
+
+def convert_char(char, revision=None, bmp_only=False, on_astral=None):
+    # If bmp_only is True, characters that would convert to something outside the BMP are left unchanged,
+    # or replaced with what on_astral(char, output) returns
+    _check_char(char)
+
+    if on_astral is not None:
+        if not bmp_only:
+            raise ValueError("on_astral argument can only be used with bmp_only")
+        return _convert_astral(_tables_for(revision), char, on_astral)
+
+    if revision is None and not bmp_only:
+        tables = _tables or _get_tables()
+    else:
+        tables = _tables_for(revision, bmp_only)
+    return _convert_char(tables, char)
+
+
+def _needs_conversion(tables, string):
+    if string.isascii() or max(string) < tables.min_convertible:
+        return False
+    return not tables.convertible.isdisjoint(string)
+
+
+def needs_conversion(string, revision=None, bmp_only=False):
+    if not isinstance(string, str):
+        raise TypeError("string argument must be str type")
+
+    return _needs_conversion(_tables_for(revision, bmp_only), string)
+
+
+# Thresholds convert_string uses to choose a strategy, calibrated with benchmarks/strategies.py
+# Strings up to SHORT_STRING_LENGTH characters are converted without sampling
+SHORT_STRING_LENGTH = 128
+# Longer strings sample this many characters from the start of the string...
+SAMPLE_LENGTH = 64
+# ...and are converted in bulk if at least this fraction of the sample needs converting
+DENSE_SAMPLE_RATIO = 0.15
+
+
+def _convert_bulk(tables, string):
+    # Every character goes through the table in a single C-level pass,
+    # which costs the same no matter how many characters are converted
+    return string.translate(tables.translation_table)
+
+
+def _convert_sparse(tables, string):
+    # Only the characters that need converting are handed back to Python,
+    # and the same object is returned if nothing matches
+    return tables.pattern.sub(tables.replace_match, string)
+
+
+def _convert_string(tables, string):
+    # Return the same object if there is nothing to convert
+    if string.isascii():
+        return string
+
+    if len(string) <= SHORT_STRING_LENGTH:
+        if tables.pattern.search(string) is None:
+            return string
+        return _convert_bulk(tables, string)
+
+    sample = string[:SAMPLE_LENGTH]
+    matches = len(tables.pattern.findall(sample))
+    if matches >= DENSE_SAMPLE_RATIO * len(sample):
+        return _convert_bulk(tables, string)
+    return _convert_sparse(tables, string)
+
+
+def convert_string(string, revision=None, bmp_only=False, on_astral=None):
+    # If revision is given (e.g. 2004), only conversions that were part of that revision of the standard are made.
+    # If bmp_only is True, characters that would convert to something outside the BMP are left unchanged,
+    # or replaced with what on_astral(char, output) returns
+    if not isinstance(string, str):
+        raise TypeError("string argument must be str type")
+
+    if on_astral is not None:
+        if not bmp_only:
+            raise ValueError("on_astral argument can only be used with bmp_only")
+        return _convert_astral(_tables_for(revision), string, on_astral)
+
+    if revision is None and not bmp_only:
+        tables = _tables or _get_tables()
+    else:
+        tables = _tables_for(revision, bmp_only)
+    return _convert_string(tables, string)
+
+
+def convert_string_stamped(string, revision=None, bmp_only=False):
+    # Returns the converted string, and the fingerprint() of the mappings it was converted with
+    if not isinstance(string, str):
+        raise TypeError("string argument must be str type")
+
+    tables = _tables_for(revision, bmp_only)
+    return _convert_string(tables, string), tables.fingerprint
+
+
+# Offsets are stored in a compact array of unsigned ints of at least 32 bits
+_OFFSET_TYPECODE = "I" if array("I").itemsize >= 4 else "L"
+
+
+def _utf16_length(string):
+    return len(string.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def _convert_with_offsets(tables, string, utf16):
+    converted = _convert_string(tables, string)
+    length = _utf16_length if utf16 else len
+
+    # Every output is at least one codepoint long, so if the lengths match, nothing moved
+    if converted is string or (not utf16 and len(converted) == len(string)):
+        return converted, array(_OFFSET_TYPECODE, range(length(string) + 1))
+
+    offsets = array(_OFFSET_TYPECODE)
+    position = 0  # Position in the original string, in the units being counted
+    shift = 0  # Difference between positions in the converted and original strings
+    previous = 0  # Index in the original string following the last match
+    for match in tables.pattern.finditer(string):
+        start = match.start()
+        end = position + length(string[previous:start])
+        offsets.extend(range(position + shift, end + shift))
+        position = end
+
+        char = match.group()
+        size = length(char)
+        offsets.extend([position + shift] * size)
+        position += size
+        shift += length(tables.translation_table[ord(char)]) - size
+        previous = start + 1
+
+    end = position + length(string[previous:])
+    offsets.extend(range(position + shift, end + shift + 1))
+    return converted, offsets
+
+
+def convert_string_with_offsets(string, utf16=False, revision=None, bmp_only=False):
+    # Returns the converted string and an array of offsets, where offsets[i] is the position in the converted string
+    # of the character that starts at position i of the original string, and offsets[-1] is the length of the
+    # converted string. A span (start, end) of the original string is (offsets[start], offsets[end]) once converted.
+    # Positions count codepoints, like str indexes do, or UTF-16 code units if utf16 is True
+    # (then a position inside a converted surrogate pair maps to the start of what it was converted to).
     if not isinstance(string, str):
         raise TypeError("string argument must be str type")
 
-    return "".join([convert_char(char) for char in string])
+    return _convert_with_offsets(_tables_for(revision, bmp_only), string, utf16)
+
+
+def _convert_many(strings, tables):
+    # Each distinct string is only converted once
+    converted = {}
+    for string in strings:
+        result = converted.get(string)
+        if result is None:
+            if not isinstance(string, str):
+                raise TypeError("strings argument must only contain str type")
+            result = converted[string] = _convert_string(tables, string)
+        yield result
+
+
+def convert_many(strings, lazy=False, revision=None, bmp_only=False):
+    # Returns a list of converted strings in the same order as strings,
+    # or an iterator over them if lazy is True
+    if isinstance(strings, str):
+        raise TypeError("strings argument must be an iterable of str, not str")
+
+    tables = _tables_for(revision, bmp_only)
+    if lazy:
+        return _convert_many(strings, tables)
+    return list(_convert_many(strings, tables))
+
+
+class Converter:
+    # Converts with its own selection of the mapping data, for applications that need several at once
+    # (e.g. one per tenant), with the same methods as the module's functions:
+    # - files: the names of the entries in config.json to use, e.g. ["gccs", "hkscs2016"] (by default, all of them)
+    # - revision: leave out what was added after this revision of the standard (see convert_string())
+    # - overlays: paths to overlay files applied after config.json and the overlays passed to reload()
+    # - bmp_only: leave out conversions to characters outside the BMP (see convert_string())
+    # The tables are only built when they're first used, and Converters with the same configuration share them.
+    # Without files or overlays, they're the module's own tables, and otherwise they share every output
+    # they have in common with those, and are compiled from the mappings each data file was parsed into
+    # the first time it was used (see _loader.load_shared_mappings()). They follow reload() like the module's functions do.
+    def __init__(self, files=None, revision=None, overlays=(), bmp_only=False):
+        if isinstance(files, str):
+            raise TypeError("files argument must be an iterable of names, not str")
+        if revision is not None and not isinstance(revision, int):
+            raise TypeError("revision argument must be int type")
+        if isinstance(overlays, str):
+            raise TypeError("overlays argument must be an iterable of paths, not str")
+
+        self.files = None if files is None else frozenset(files)
+        self.revision = revision
+        self.overlays = tuple(overlays)
+        self.bmp_only = bmp_only
+
+    def __repr__(self):
+        return "Converter(files=%r, revision=%r, overlays=%r, bmp_only=%r)" % (
+            None if self.files is None else sorted(self.files),
+            self.revision,
+            list(self.overlays),
+            self.bmp_only,
+        )
+
+    def _all_tables(self):
+        # The tables including conversions to characters outside the BMP, even if bmp_only is True
+        return _get_configured_tables(self.files, self.revision, self.overlays)
+
+    def _tables(self):
+        tables = self._all_tables()
+        return tables.bmp if self.bmp_only else tables
+
+    def warmup(self):
+        # Build the tables now, instead of on the first conversion
+        self._tables()
+
+    @property
+    def translation_table(self):
+        return self._tables().translation_view
+
+    @property
+    def pattern(self):
+        return self._tables().pattern
+
+    def fingerprint(self):
+        return self._tables().fingerprint
+
+    def astral_skipped(self):
+        return len(self._all_tables().bmp.astral)
+
+    def _check_on_astral(self, on_astral):
+        if on_astral is not None and not self.bmp_only:
+            raise ValueError("on_astral argument can only be used with bmp_only")
+
+    def convert_char(self, char, on_astral=None):
+        _check_char(char)
+        self._check_on_astral(on_astral)
+
+        if on_astral is not None:
+            return _convert_astral(self._all_tables(), char, on_astral)
+        return _convert_char(self._tables(), char)
+
+    def needs_conversion(self, string):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+
+        return _needs_conversion(self._tables(), string)
+
+    def convert_string(self, string, on_astral=None):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+        self._check_on_astral(on_astral)
+
+        if on_astral is not None:
+            return _convert_astral(self._all_tables(), string, on_astral)
+        return _convert_string(self._tables(), string)
+
+    def convert_string_stamped(self, string):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+
+        tables = self._tables()
+        return _convert_string(tables, string), tables.fingerprint
+
+    def convert_string_with_offsets(self, string, utf16=False):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+
+        return _convert_with_offsets(self._tables(), string, utf16)
+
+    def convert_many(self, strings, lazy=False):
+        if isinstance(strings, str):
+            raise TypeError("strings argument must be an iterable of str, not str")
+
+        tables = self._tables()
+        if lazy:
+            return _convert_many(strings, tables)
+        return list(_convert_many(strings, tables))
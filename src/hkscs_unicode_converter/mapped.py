@@ -0,0 +1,163 @@
+# A read-only lookup table stored in a binary file and queried through mmap,
+# so that every process opening the same file shares one copy of it in the page cache.
+# Build the file with `python3 -m hkscs_unicode_converter.build --target binary`.
+#
+# The file is an array of unsigned 32-bit ints in the byte order of the machine that built it:
+# - an 8 byte magic string, followed by a header of _HEADER_FIELDS words
+# - a dense block with one entry for each codepoint from pua_start to pua_start + pua_count - 1
+# - sorted records for the keys outside of that block, each a key followed by an entry
+# Each entry is width codepoints of output, padded with _EMPTY. An entry starting with _EMPTY has no mapping.
+import mmap
+from array import array
+
+from . import _lookup
+from .converter import _PUA_END, _PUA_START
+
+MAGIC = b"HKSCSMAP"
+FORMAT = 1
+
+_BYTE_ORDER_MARK = 0x01020304
+_EMPTY = 0xFFFFFFFF
+_HEADER_FIELDS = ("format", "byte_order", "width", "pua_start", "pua_count", "records")
+_HEADER_WORDS = len(_HEADER_FIELDS)
+_WORDS_START = len(MAGIC) // 4 + _HEADER_WORDS
+
+
+def pack_table(table):
+    # Returns the contents of a binary table file for a table of codepoint (int) -> output (str)
+    width = max([len(output) for output in table.values()], default=1)
+
+    def entry(output):
+        return [ord(char) for char in output] + [_EMPTY] * (width - len(output))
+
+    pua = array("I", [_EMPTY]) * ((_PUA_END - _PUA_START + 1) * width)
+    records = array("I")
+    for codepoint in sorted(table):
+        if _PUA_START <= codepoint <= _PUA_END:
+            index = (codepoint - _PUA_START) * width
+            pua[index : index + width] = array("I", entry(table[codepoint]))
+        else:
+            records.append(codepoint)
+            records.extend(entry(table[codepoint]))
+
+    header = array(
+        "I",
+        [
+            FORMAT,
+            _BYTE_ORDER_MARK,
+            width,
+            _PUA_START,
+            _PUA_END - _PUA_START + 1,
+            len(records) // (width + 1),
+        ],
+    )
+    return MAGIC + header.tobytes() + pua.tobytes() + records.tobytes()
+
+
+class MappedTable:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if self._mmap[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a binary HKSCS table")
+            if len(self._mmap) < _WORDS_START * 4 or len(self._mmap) % 4:
+                raise ValueError(f"{path} is truncated")
+            self._words = memoryview(self._mmap).cast("I")
+            header = dict(
+                zip(_HEADER_FIELDS, self._words[len(MAGIC) // 4 : _WORDS_START])
+            )
+            if header["format"] != FORMAT:
+                raise ValueError(f"{path} has unknown format {header['format']}")
+            if header["byte_order"] != _BYTE_ORDER_MARK:
+                raise ValueError(
+                    f"{path} was built on a machine with another byte order"
+                )
+
+            self._width = header["width"]
+            self._pua_start = header["pua_start"]
+            self._pua_count = header["pua_count"]
+            self._records_start = _WORDS_START + self._pua_count * self._width
+            self._records = header["records"]
+            if len(self._words) < self._records_start + self._records * (
+                self._width + 1
+            ):
+                raise ValueError(f"{path} is truncated")
+        except Exception:
+            self.close()
+            raise
+
+        # The pattern is the only thing built per process, and is much smaller than the table
+        self.pattern = _lookup.compile_pattern(self._keys())
+
+    def _keys(self):
+        words, width = self._words, self._width
+        for index in range(self._pua_count):
+            if words[_WORDS_START + index * width] != _EMPTY:
+                yield self._pua_start + index
+        for index in range(self._records):
+            yield words[self._records_start + index * (width + 1)]
+
+    def _entry(self, codepoint):
+        # Returns the index of the entry for codepoint, or None if there isn't one
+        words, width = self._words, self._width
+        if 0 <= codepoint - self._pua_start < self._pua_count:
+            return _WORDS_START + (codepoint - self._pua_start) * width
+
+        # Binary search through the records
+        low, high = 0, self._records
+        while low < high:
+            middle = (low + high) // 2
+            key = words[self._records_start + middle * (width + 1)]
+            if key < codepoint:
+                low = middle + 1
+            elif key > codepoint:
+                high = middle
+            else:
+                return self._records_start + middle * (width + 1) + 1
+        return None
+
+    def lookup(self, codepoint):
+        # Returns what codepoint (int) converts to, or None if it isn't converted
+        index = self._entry(codepoint)
+        if index is None or self._words[index] == _EMPTY:
+            return None
+        return "".join(
+            [
+                chr(word)
+                for word in self._words[index : index + self._width]
+                if word != _EMPTY
+            ]
+        )
+
+    def convert_char(self, char):
+        if not isinstance(char, str):
+            raise TypeError("char argument must be str type")
+
+        if len(char) != 1:
+            raise ValueError("char argument must be exactly length 1")
+
+        output = self.lookup(ord(char))
+        return char if output is None else output
+
+    def _replace_match(self, match):
+        return self.lookup(ord(match.group()))
+
+    def convert_string(self, string):
+        if not isinstance(string, str):
+            raise TypeError("string argument must be str type")
+
+        return self.pattern.sub(self._replace_match, string)
+
+    def close(self):
+        if getattr(self, "_words", None) is not None:
+            self._words.release()
+            self._words = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
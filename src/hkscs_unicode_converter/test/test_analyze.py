@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from hkscs_unicode_converter import analyze, converter
+
+
+class TestAnalyze(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.report = analyze.analyze_data_dir()
+
+    def test_chains(self):
+        chains = {chain["codepoint"]: chain for chain in self.report["chains"]}
+        self.assertEqual(sorted(chains), ["E53B", "EC77"])
+        self.assertEqual(
+            chains["EC77"]["hops"],
+            [
+                {"file": "hkscs1999", "output": chr(0x4CA4)},
+                {"file": "hkscs2016", "output": chr(0x9FD0)},
+            ],
+        )
+        for codepoint, chain in chains.items():
+            self.assertEqual(
+                chain["output"], converter.translation_table[int(codepoint, 16)]
+            )
+
+    def test_conflicts(self):
+        conflicts = {conflict["codepoint"] for conflict in self.report["conflicts"]}
+        self.assertEqual(conflicts, {"E6C5", "ED64", "F570"})
+
+    def test_cycles(self):
+        self.assertEqual(
+            [cycle["codepoints"] for cycle in self.report["cycles"]],
+            [["3D1D", "2A3ED"], ["4CA4", "9FD0"]],
+        )
+
+    def test_reconverted(self):
+        for entry in self.report["reconverted"]:
+            self.assertEqual(
+                converter.translation_table[ord(entry["output"])], entry["converted"]
+            )
+        self.assertEqual(len(self.report["reconverted"]), 6)
+
+    def test_unreachable(self):
+        # The walk stops at the <00CA,0304> sequences from HKSCS-2004, so HKSCS-2008's rows for them are never used
+        sequences = [
+            entry["codepoint"]
+            for entry in self.report["unreachable"]
+            if entry["reason"] == "sequence"
+        ]
+        self.assertEqual(sequences, ["F325", "F327", "F344", "F346"])
+
+        # E6C5 is converted as GCCS mapped it, instead of as HKSCS-2001 remapped it
+        entry = self.report["unreachable"][1]
+        self.assertEqual(entry["codepoint"], "E6C5")
+        self.assertEqual(entry["reason"], "remapped")
+        self.assertNotEqual(converter.translation_table[0xE6C5], entry["output"])
+
+    def test_synthetic(self):
+        files = [{"name": "a"}, {"name": "b"}]
+        mappings = [
+            {"E000": ("E001",), "E001": ("E002",), "00E0": ("E003",)},
+            {"E002": ("E000",), "E000": ("E003",)},
+        ]
+        report = analyze.analyze(files, mappings)
+        self.assertEqual(report["cycles"][0]["codepoints"], ["E000", "E001", "E002"])
+        self.assertEqual(
+            [(entry["codepoint"], entry["reason"]) for entry in report["unreachable"]],
+            [("00E0", "key"), ("E000", "remapped")],
+        )
+        self.assertEqual(report["conflicts"][0]["codepoint"], "E000")
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "analysis.json")
+            with mock.patch("sys.stderr", io.StringIO()) as stderr:
+                analyze.main(["--output", path])
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(json.load(f), self.report)
+        self.assertIn("2 chains", stderr.getvalue())
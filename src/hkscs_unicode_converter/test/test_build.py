@@ -0,0 +1,391 @@
+import hashlib
+import importlib.resources as pkg_resources
+import importlib.util
+import io
+import json
+import marshal
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from unittest import TestCase, mock
+
+from hkscs_unicode_converter import _loader, _lookup, build, converter, data
+
+
+class TestArtifact(TestCase):
+    def test_up_to_date(self):
+        # If this fails, run `python3 -m hkscs_unicode_converter.build` to rebuild the artifact
+        with pkg_resources.open_text(data, _loader.ARTIFACT_NAME) as f:
+            artifact = json.load(f)
+        self.assertEqual(artifact, build.compile_artifact())
+
+    def test_same_as_data_files(self):
+        config, files = _loader.load_config()
+        table, chains = _loader.compile_table(_loader.load_mappings(files))
+        compiled = _loader.read_artifact(hashlib.sha256(config).hexdigest())
+        self.assertEqual(compiled, (table, chains))
+
+    def test_loaded_at_runtime(self):
+        self.assertEqual(converter.translation_table[0xEC77], chr(0x9FD0))
+        self.assertEqual(converter.translation_table[0xF327], "Ê̌")
+
+    def test_different_config(self):
+        self.assertIsNone(_loader.read_artifact(hashlib.sha256(b"[]").hexdigest()))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "compiled.json")
+            build.main(["--output", path])
+            with open(path, encoding="utf-8") as f:
+                artifact = json.load(f)
+        self.assertEqual(artifact["format"], _loader.ARTIFACT_FORMAT)
+        self.assertEqual(len(artifact["keys"]), len(converter.translation_table))
+
+
+class TestIncremental(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Paths compiled before hkscs2016 was added to the end of config.json
+        config, files = _loader.load_config()
+        cls.files = files[:-1]
+        cls.paths = _loader.compile_paths(_loader.load_mappings(cls.files))
+        cls.config = json.dumps(cls.files).encode("utf-8")
+
+    def test_paths_up_to_date(self):
+        # If this fails, run `python3 -m hkscs_unicode_converter.build` to rebuild the artifact
+        with pkg_resources.open_text(data, build.PATHS_NAME) as f:
+            artifact = json.load(f)
+        self.assertEqual(artifact, build.compile_paths_artifact())
+
+    def test_same_as_full_build(self):
+        artifact, paths_artifact, _ = build.compile_incremental(self.files, self.paths)
+        self.assertEqual(artifact, build.compile_artifact())
+        self.assertEqual(paths_artifact, build.compile_paths_artifact())
+
+    def test_diff(self):
+        _, _, diff = build.compile_incremental(self.files, self.paths)
+        self.assertEqual(
+            diff,
+            [
+                {"codepoint": "3D1D", "before": None, "after": chr(0x2A3ED)},
+                {"codepoint": "4CA4", "before": None, "after": chr(0x9FD0)},
+                {"codepoint": "9FD0", "before": None, "after": chr(0x4CA4)},
+                {"codepoint": "E53B", "before": chr(0x3D1D), "after": chr(0x2A3ED)},
+                {"codepoint": "EC77", "before": chr(0x4CA4), "after": chr(0x9FD0)},
+                {"codepoint": "2A3ED", "before": None, "after": chr(0x3D1D)},
+            ],
+        )
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths_artifact = build._paths_artifact(self.config, self.files, self.paths)
+            build.write_artifact(
+                paths_artifact, os.path.join(directory, build.PATHS_NAME)
+            )
+            output = os.path.join(directory, "compiled.json")
+            diff = os.path.join(directory, "diff.json")
+            blob = os.path.join(directory, build.TARGETS["blob"])
+            with open(blob, "wb") as f:
+                f.write(b"stale")
+            with mock.patch("sys.stderr", io.StringIO()):
+                build.main(["--incremental", "--output", output, "--diff", diff])
+
+            with open(output, encoding="utf-8") as f:
+                self.assertEqual(json.load(f), build.compile_artifact())
+            with open(blob, "rb") as f:
+                self.assertEqual(
+                    marshal.loads(f.read()), marshal.loads(build.generate_blob())
+                )
+            with open(diff, encoding="utf-8") as f:
+                self.assertEqual(len(json.load(f)), 6)
+
+            # The paths were updated too, so there is nothing left to add
+            with self.assertRaises(ValueError):
+                build.main(["--incremental", "--output", output, "--diff", diff])
+
+    def test_not_appended(self):
+        with self.assertRaises(ValueError):
+            build.compile_incremental(self.files[1:], self.paths)
+
+
+class TestCompiledCache(TestCase):
+    # Simulates a customized config.json, which the packaged artifact wasn't built from
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for patcher in [
+            mock.patch.dict(os.environ, {_loader.CACHE_VARIABLE: self.directory.name}),
+            mock.patch.object(_loader, "read_artifact", return_value=None),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.config, self.files = _loader.load_config()
+        self.key = _loader.data_hash(self.config, self.files)
+
+    def cached_files(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_written_and_reused(self):
+        files, table, chains = _loader.load_compiled(self.config)
+        self.assertEqual(table, converter.translation_table)
+        self.assertEqual(self.cached_files(), [f"{self.key}.json"])
+
+        with mock.patch.object(_loader, "compile_table") as compile_table:
+            self.assertEqual(_loader.load_compiled(self.config), (files, table, chains))
+        compile_table.assert_not_called()
+
+    def test_key(self):
+        self.assertEqual(self.key, _loader.data_hash(self.config, self.files))
+        self.assertNotEqual(self.key, _loader.data_hash(self.config + b" ", self.files))
+        self.assertNotEqual(self.key, _loader.data_hash(self.config, self.files[1:]))
+        with mock.patch.object(
+            _loader, "COMPILER_VERSION", _loader.COMPILER_VERSION + 1
+        ):
+            self.assertNotEqual(self.key, _loader.data_hash(self.config, self.files))
+
+    def test_corrupt(self):
+        with open(os.path.join(self.directory.name, f"{self.key}.json"), "w") as f:
+            f.write('{"format": 1, "ke')
+        _, table, _ = _loader.load_compiled(self.config)
+        self.assertEqual(table, converter.translation_table)
+        self.assertEqual(_loader.read_cache(self.directory.name, self.key)[0], table)
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {_loader.CACHE_VARIABLE: ""}):
+            self.assertIsNone(_loader.cache_directory())
+            _, table, _ = _loader.load_compiled(self.config)
+        self.assertEqual(table, converter.translation_table)
+        self.assertEqual(self.cached_files(), [])
+
+    def test_unwritable(self):
+        path = os.path.join(self.directory.name, "file")
+        open(path, "w").close()
+        _loader.write_cache(os.path.join(path, "cache"), self.key, {}, {})
+        self.assertEqual(self.cached_files(), ["file"])
+
+    def test_concurrent_writes(self):
+        table, chains = dict(converter.translation_table), converter._chains
+        threads = [
+            threading.Thread(
+                target=_loader.write_cache,
+                args=(self.directory.name, self.key, table, chains),
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cached_files(), [f"{self.key}.json"])
+        self.assertEqual(
+            _loader.read_cache(self.directory.name, self.key), (table, chains)
+        )
+
+
+class TestDelta(TestCase):
+    def decode(self, base, delta):
+        operations = io.StringIO(delta)
+        self.assertEqual(_loader._delta_base("delta", operations), "base.tsv")
+        return "".join(_loader._apply_delta(iter(base), operations))
+
+    def test_round_trip(self):
+        base = ["a\n", "b\n", "c\n", "d\n", "e"]
+        for lines in [
+            base,
+            ["a\n", "c\n", "d\n", "e"],
+            ["x\n", "a\n", "b\n", "y\n", "d\n", "e\n", "f"],
+            ["a\n", "b\n"],
+            ["a\n", "b\n", "c"],
+            [],
+        ]:
+            delta = build.encode_delta("base.tsv", base, lines)
+            self.assertEqual(self.decode(base, delta), "".join(lines))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            _loader._delta_base("delta", io.StringIO("=1\n"))
+        with self.assertRaises(ValueError):
+            self.decode(["a\n"], "#base base.tsv\n*1\n")
+
+    def test_stored(self):
+        # Each delta in the data directory is what --delta writes for the file it decodes to
+        _, files = _loader.load_config()
+        names = [_loader.data_file_name(file) for file in files]
+        deltas = [name for name in names if name.endswith(_loader.DELTA_SUFFIX)]
+        self.assertEqual(len(deltas), 4)
+        for name in deltas:
+            base_name = _loader._data_names(name)[1]
+            with _loader._open_data(base_name) as f:
+                base = list(f)
+            with _loader._open_data(name) as f:
+                lines = list(f)
+            self.assertEqual(
+                build.encode_delta(base_name, base, lines),
+                pkg_resources.read_text(data, name),
+            )
+
+
+class TestParsing(TestCase):
+    def test_tsv_columns(self):
+        stream = io.StringIO(
+            "Big5\tUnicode\tBig5Alternate\tUnicodeName\n"
+            "0x01\tU+0041\tU+E000\tA\n"
+            "0x02\n"
+        )
+        items = list(_loader._process_tsv(stream, ["Big5Alternate", "Unicode"]))
+        self.assertEqual(
+            items,
+            [
+                {"Big5Alternate": "U+E000", "Unicode": "U+0041"},
+                {"Big5Alternate": "", "Unicode": ""},
+            ],
+        )
+
+    def test_json_columns(self):
+        stream = io.StringIO('[{"codepoint": "E000", "char": "A", "cangjie": "X"}]')
+        items = _loader._process_json(stream, ["codepoint", "char"])
+        self.assertEqual(items, [{"codepoint": "E000", "char": "A"}])
+
+
+class TestGeneratedModule(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "_compiled.py")
+            build.main(["--target", "python", "--output", path])
+            spec = importlib.util.spec_from_file_location("_compiled", path)
+            cls.module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(cls.module)
+
+    def test_same_as_data_files(self):
+        tables = _lookup.load_generated(self.module, _lookup.read_config())
+        self.assertEqual(tables.translation_table, converter.translation_table)
+        self.assertEqual(tables.chains, converter._chains)
+        self.assertEqual(tables.files, converter._files)
+
+    def test_different_config(self):
+        self.assertIsNone(_lookup.load_generated(self.module, b"[]"))
+
+    def test_sources(self):
+        self.assertEqual(self.module.SOURCES, build.compile_artifact()["sources"])
+
+
+class TestBlob(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, _lookup.BLOB_NAME)
+            build.main(["--target", "blob", "--output", path])
+            with open(path, "rb") as f:
+                cls.blob = f.read()
+
+    def test_same_as_data_files(self):
+        tables = _lookup.load_blob(self.blob, _lookup.read_config())
+        self.assertEqual(tables.translation_table, converter.translation_table)
+        self.assertEqual(tables.chains, converter._chains)
+        self.assertEqual(tables.files, converter._files)
+
+    def test_different_config(self):
+        self.assertIsNone(_lookup.load_blob(self.blob, b"[]"))
+
+    def test_invalid(self):
+        config = _lookup.read_config()
+        self.assertIsNone(_lookup.load_blob(self.blob[:100], config))
+        self.assertIsNone(_lookup.load_blob(b"", config))
+        self.assertIsNone(_lookup.load_blob(marshal.dumps([1]), config))
+
+    def test_zip_file(self):
+        # The package is imported from a zip file, like in a zipapp, and loads the blob without parsing anything
+        package_root = os.path.dirname(os.path.dirname(converter.__file__))
+        package = os.path.dirname(converter.__file__)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "package.zip")
+            with zipfile.ZipFile(path, "w") as archive:
+                for parent, names, files in os.walk(package):
+                    names[:] = [
+                        name for name in names if name not in ("test", "__pycache__")
+                    ]
+                    for name in files:
+                        file = os.path.join(parent, name)
+                        archive.write(file, os.path.relpath(file, package_root))
+                archive.writestr(
+                    f"hkscs_unicode_converter/data/{_lookup.BLOB_NAME}", self.blob
+                )
+
+            code = (
+                "import sys\n"
+                "from hkscs_unicode_converter import converter\n"
+                "assert converter.__file__.startswith(sys.argv[1])\n"
+                "assert converter.convert_char('\\uec77') == '\\u9fd0'\n"
+                "assert 'json' not in sys.modules\n"
+            )
+            subprocess.run(
+                [sys.executable, "-c", code, path],
+                check=True,
+                cwd=directory,
+                env=dict(os.environ, PYTHONPATH=path),
+            )
+
+
+class TestPackagedGenerated(TestCase):
+    # The generated module and the blob take precedence over compiled.json, so they mustn't be left stale
+    def setUp(self):
+        with pkg_resources.open_text(data, _loader.ARTIFACT_NAME) as f:
+            self.artifact = json.load(f)
+        self.directory = os.path.dirname(data.__file__)
+
+    def assertMatchesArtifact(self, constants):
+        self.assertEqual(constants["SOURCES"], self.artifact["sources"])
+        tables = _lookup._load_constants("generated", constants, _lookup.read_config())
+        table, chains = _loader.unpack_table(self.artifact)
+        self.assertEqual(tables.translation_table, table)
+        self.assertEqual(tables.chains, chains)
+
+    def test_module(self):
+        path = os.path.join(self.directory, build.TARGETS["python"])
+        if not os.path.exists(path):
+            self.skipTest("no generated module")
+        spec = importlib.util.spec_from_file_location("_compiled", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.assertMatchesArtifact(vars(module))
+
+    def test_blob(self):
+        path = os.path.join(self.directory, build.TARGETS["blob"])
+        if not os.path.exists(path):
+            self.skipTest("no blob")
+        with open(path, "rb") as f:
+            self.assertMatchesArtifact(marshal.loads(f.read()))
+
+    def test_rebuilt(self):
+        # Rebuilding the json artifact rebuilds a stale module or blob next to it
+        with tempfile.TemporaryDirectory() as directory:
+            module = os.path.join(directory, build.TARGETS["python"])
+            blob = os.path.join(directory, build.TARGETS["blob"])
+            with open(module, "w") as f:
+                f.write("FORMAT = 1\n")
+            with open(blob, "wb") as f:
+                f.write(b"stale")
+            with mock.patch("sys.stdout", io.StringIO()):
+                build.main(["--output", os.path.join(directory, "compiled.json")])
+
+            with open(module, encoding="ascii") as f:
+                self.assertEqual(f.read(), build.generate_module())
+            with open(blob, "rb") as f:
+                self.assertMatchesArtifact(marshal.loads(f.read()))
+
+
+class TestImport(TestCase):
+    def test_no_parsing_modules(self):
+        # Importing converter shouldn't import anything only needed for parsing the data
+        code = (
+            "import sys\n"
+            "from hkscs_unicode_converter import converter\n"
+            "assert 'csv' not in sys.modules\n"
+            "assert 'json' not in sys.modules\n"
+        )
+        package_root = os.path.dirname(os.path.dirname(converter.__file__))
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=package_root)
@@ -0,0 +1,116 @@
+import threading
+from unittest import TestCase, mock
+
+from hkscs_unicode_converter import _lookup, converter
+from hkscs_unicode_converter.cache import ConversionCache
+
+
+class TestValid(TestCase):
+    def test_convert(self):
+        cache = ConversionCache()
+        res = cache.convert_string("唔牙")
+        self.assertEqual(res, "唔啱牙")
+
+    def test_hits_and_misses(self):
+        cache = ConversionCache()
+        cache.convert_string("唔牙")
+        cache.convert_string("唔牙")
+        cache.convert_string("Hi!")
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_max_entries(self):
+        cache = ConversionCache(max_entries=2)
+        cache.convert_string("a")
+        cache.convert_string("b")
+        cache.convert_string("a")  # "b" is now the least recently used
+        cache.convert_string("c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+        cache.convert_string("a")
+        self.assertEqual(cache.hits, 2)
+        cache.convert_string("b")
+        self.assertEqual(cache.misses, 4)
+
+    def test_max_chars(self):
+        # "" and "啱" are both counted
+        cache = ConversionCache(max_chars=5)
+        cache.convert_string("")
+        cache.convert_string("abc")
+        self.assertEqual(cache.chars, 5)
+        cache.convert_string("d")
+        self.assertEqual(cache.chars, 4)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_too_long_to_cache(self):
+        cache = ConversionCache(max_chars=2)
+        res = cache.convert_string("abc")
+        self.assertEqual(res, "abc")
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        cache = ConversionCache()
+        cache.convert_string("a")
+        cache.convert_string("a")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.chars, 0)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (0, 0, 0))
+
+    def test_threads(self):
+        cache = ConversionCache(max_entries=8)
+        strings = ["唔牙%d" % index for index in range(16)]
+        results = []
+
+        def convert():
+            for _ in range(50):
+                results.extend([cache.convert_string(string) for string in strings])
+
+        threads = [threading.Thread(target=convert) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 4 * 50 * 16)
+        self.assertTrue(all([result.startswith("唔啱牙") for result in results]))
+        self.assertEqual(cache.hits + cache.misses, len(results))
+        self.assertLessEqual(len(cache), 8)
+
+    def test_fingerprint_cached(self):
+        # The fingerprint is only looked up again once the tables are replaced
+        cache = ConversionCache()
+        cache.convert_string("a")
+        with mock.patch.object(
+            _lookup.Tables, "fingerprint", new_callable=mock.PropertyMock
+        ) as fingerprint:
+            cache.convert_string("a")
+            cache.convert_string("b")
+        fingerprint.assert_not_called()
+
+    def test_converter(self):
+        tenant = converter.Converter(bmp_only=True)
+        cache = ConversionCache(
+            convert=tenant.convert_string, fingerprint=tenant.fingerprint
+        )
+        self.assertEqual(cache.convert_string("\uf308\ue7d4"), "\uf308啱")
+        self.assertEqual(cache.convert_string("\uf308\ue7d4"), "\uf308啱")
+        self.assertEqual(cache.hits, 1)
+
+
+class TestInvalid(TestCase):
+    def test_not_string(self):
+        with self.assertRaises(TypeError):
+            ConversionCache().convert_string(-1)
+
+    def test_convert_without_fingerprint(self):
+        with self.assertRaises(TypeError):
+            ConversionCache(convert=converter.Converter(bmp_only=True).convert_string)
+
+    def test_bad_bounds(self):
+        with self.assertRaises(ValueError):
+            ConversionCache(max_entries=0)
+        with self.assertRaises(ValueError):
+            ConversionCache(max_chars=0)
@@ -3097,6 +3097,16 @@ class TestValid(TestCase):
         res = converter.convert_char(chr(0x3D1D))
         self.assertEqual(res, chr(0x2A3ED))
 
+    def test_flattened_chains(self):
+        # Chains that were remapped more than once are resolved when the data is loaded
+        self.assertEqual(
+            converter._chains[0xEC77], (chr(0xEC77), chr(0x4CA4), chr(0x9FD0))
+        )
+        self.assertEqual(
+            converter._chains[0xE53B], (chr(0xE53B), chr(0x3D1D), chr(0x2A3ED))
+        )
+        self.assertEqual(converter.translation_table[0xEC77], chr(0x9FD0))
+
 
 class TestInvalid(TestCase):
     def test_no_arg(self):
@@ -3140,3 +3150,11 @@ class TestNoChangeNeeded(TestCase):
     def test_sinhala(self):
         res = converter.convert_string("අ")
         self.assertEqual(res, "අ")
+
+    def test_unassigned_pua(self):
+        # PUA codepoints that HKSCS never used should be left alone
+        res = converter.convert_char(chr(0xE6C6))
+        self.assertEqual(res, chr(0xE6C6))
+
+        res = converter.convert_char(chr(0xF8FF))
+        self.assertEqual(res, chr(0xF8FF))
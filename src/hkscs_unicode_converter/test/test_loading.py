@@ -0,0 +1,429 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from hkscs_unicode_converter import _loader, _lookup, converter, data
+from hkscs_unicode_converter.cache import ConversionCache
+
+
+class TestLazyLoading(TestCase):
+    def setUp(self):
+        # Pretend the data hasn't been loaded yet
+        self.tables = converter._get_tables()
+        self.load_tables = converter._load_tables
+        self.loads = 0
+        converter._tables = None
+
+        def load():
+            self.loads += 1
+            return self.tables
+
+        converter._load_tables = load
+
+    def tearDown(self):
+        converter._tables = self.tables
+        converter._load_tables = self.load_tables
+
+    def test_not_loaded_on_import(self):
+        code = (
+            "from hkscs_unicode_converter import converter\n"
+            "assert converter._tables is None\n"
+            "converter.convert_string('a')\n"
+            "assert converter._tables is not None\n"
+        )
+        package_root = os.path.dirname(os.path.dirname(converter.__file__))
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=package_root)
+
+    def test_loaded_on_first_conversion(self):
+        self.assertEqual(converter.convert_char("\uecd1"), "嘅")
+        self.assertEqual(converter.convert_string("\uecd1"), "嘅")
+        self.assertEqual(self.loads, 1)
+
+    def test_warmup(self):
+        converter.warmup()
+        self.assertIs(converter._tables, self.tables)
+        converter.warmup()
+        self.assertEqual(self.loads, 1)
+
+    def test_module_attribute(self):
+        self.assertIs(converter.translation_table, self.tables.translation_view)
+        self.assertEqual(self.loads, 1)
+
+        with self.assertRaises(AttributeError):
+            converter.not_an_attribute
+
+    def test_threads(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def convert():
+            barrier.wait()
+            results.append(converter.convert_string("唔\ue7d4牙"))
+
+        threads = [threading.Thread(target=convert) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["唔啱牙"] * 8)
+        self.assertEqual(self.loads, 1)
+
+
+class ReloadTestCase(TestCase):
+    # Restores the module's tables, and the tables compiled from them, after each test.
+    # Tables compiled during the test are cached in a temporary directory, self.directory,
+    # and every data file the test compiles is parsed again
+    def setUp(self):
+        self.tables = converter._get_tables()
+        self.addCleanup(setattr, converter, "_tables", self.tables)
+        self.addCleanup(setattr, converter, "_source", converter._source)
+        self.addCleanup(setattr, converter, "_revision_tables", {})
+        self.addCleanup(setattr, converter, "_configured_tables", {})
+        converter._revision_tables = {}
+        converter._configured_tables = {}
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for patcher in [
+            mock.patch.dict(
+                os.environ,
+                {_loader.CACHE_VARIABLE: os.path.join(directory.name, "cache")},
+            ),
+            mock.patch.dict(_loader._shared_mappings, clear=True),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestReload(ReloadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # A copy of the data directory where HKSCS-2016 no longer remaps EC77 (4CA4 -> 9FD0)
+        self.data_dir = os.path.join(self.directory, "data")
+        shutil.copytree(os.path.dirname(data.__file__), self.data_dir)
+        path = os.path.join(self.data_dir, "hkscs2016.json")
+        with open(path, encoding="utf-8") as f:
+            entries = [entry for entry in json.load(f) if entry["codepoint"] != "4CA4"]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+
+    def test_reload(self):
+        self.assertEqual(converter.convert_char("\uec77"), chr(0x9FD0))
+        converter.reload(self.data_dir)
+        self.assertEqual(converter.convert_char("\uec77"), chr(0x4CA4))
+        self.assertNotEqual(converter.fingerprint(), self.tables.fingerprint)
+
+        converter.reload()
+        self.assertEqual(converter.convert_char("\uec77"), chr(0x9FD0))
+        self.assertEqual(converter.fingerprint(), self.tables.fingerprint)
+
+    def test_background(self):
+        thread = converter.reload(self.data_dir, background=True)
+        thread.join()
+        self.assertEqual(converter.convert_string("\uec77"), chr(0x4CA4))
+
+    def test_failed_reload(self):
+        with self.assertRaises(FileNotFoundError):
+            converter.reload(os.path.join(self.data_dir, "missing"))
+        self.assertIs(converter._tables, self.tables)
+
+    def test_conversions_during_reload(self):
+        done = threading.Event()
+        results = set()
+
+        def convert():
+            while not done.wait(0.001):
+                results.add(converter.convert_string("\uec77\ue7d4"))
+
+        threads = [threading.Thread(target=convert) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        converter.reload(self.data_dir)
+        converter.reload()
+        done.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(results)
+        self.assertLessEqual(results, {"\u9fd0啱", "\u4ca4啱"})
+
+    def test_cache_invalidated(self):
+        cache = ConversionCache()
+        self.assertEqual(cache.convert_string("\uec77"), chr(0x9FD0))
+        converter.reload(self.data_dir)
+        self.assertEqual(cache.convert_string("\uec77"), chr(0x4CA4))
+        self.assertEqual(cache.misses, 2)
+
+        # Reloading the same mappings keeps the cached entries
+        converter.reload(self.data_dir)
+        cache.convert_string("\uec77")
+        self.assertEqual(cache.hits, 1)
+
+
+def write_overlay(directory):
+    # In-house assignments in PUA codepoints that HKSCS doesn't use
+    path = os.path.join(directory, "overlay.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {
+                    "name": "site",
+                    "type": "tsv",
+                    "config": {
+                        "column_from_keys": ["PUA"],
+                        "column_key_to": "Unicode",
+                    },
+                }
+            ],
+            f,
+        )
+    with open(os.path.join(directory, "site.tsv"), "w") as f:
+        f.write("PUA\tUnicode\tName\n")
+        f.write("U+E6C6\tU+4E00\tone\n")
+        f.write("U+F0000\tU+4E8C\ttwo\n")
+    return path
+
+
+class TestOverlays(ReloadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.overlay = write_overlay(self.directory)
+
+    def test_overlay(self):
+        converter.reload(overlays=[self.overlay])
+        self.assertEqual(converter.convert_char("\ue6c6"), "一")
+        self.assertEqual(converter.convert_char("\U000f0000"), "二")
+        self.assertEqual(converter.convert_char("\ue7d4"), "啱")
+        self.assertEqual(converter.convert_string("\ue6c6\ue7d4\U000f0000"), "一啱二")
+        self.assertEqual(converter._files[-1]["name"], "site")
+
+        # Compiled into the same table, so strings are still converted in one pass
+        self.assertEqual(converter.translation_table[0xE6C6], "一")
+        self.assertIsNotNone(converter.pattern.fullmatch("\U000f0000"))
+
+        converter.reload()
+        self.assertEqual(converter.convert_char("\ue6c6"), "\ue6c6")
+
+    def test_stored_paths(self):
+        # Only the overlay's data file is parsed, and the stored paths are followed through it
+        with mock.patch.object(
+            _loader, "load_mappings", wraps=_loader.load_mappings
+        ) as load_mappings:
+            converter.reload(overlays=[self.overlay])
+        self.assertEqual(
+            [
+                [file["name"] for file in call[0][0]]
+                for call in load_mappings.call_args_list
+            ],
+            [["site"]],
+        )
+
+        # The same as parsing every data file
+        tables = converter._get_tables()
+        with mock.patch.dict(os.environ, {_loader.CACHE_VARIABLE: ""}):
+            with mock.patch.object(_loader, "read_paths_artifact", return_value=None):
+                converter.reload(overlays=[self.overlay])
+        self.assertEqual(converter.translation_table, tables.translation_table)
+        self.assertEqual(converter._get_tables().chains, tables.chains)
+
+    def test_packaged_paths(self):
+        # The paths shipped with the package are only used for the data files they were compiled from
+        config, files = _loader.load_config()
+        self.assertEqual(
+            _loader.read_paths_artifact(_loader.data_hash(config, files)),
+            _loader.compile_paths(_loader.load_mappings(files)),
+        )
+        self.assertIsNone(_loader.read_paths_artifact(_loader.data_hash(config, [])))
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            converter.reload(overlays=self.overlay)
+        with self.assertRaises(FileNotFoundError):
+            converter.reload(overlays=[self.overlay + ".missing"])
+        self.assertIs(converter._tables, self.tables)
+
+
+class TestRevisions(ReloadTestCase):
+    def test_cutoff(self):
+        # EC77 was 4CA4 until HKSCS-2016 remapped it to 9FD0
+        self.assertEqual(converter.convert_char("\uec77", revision=2008), "\u4ca4")
+        self.assertEqual(converter.convert_char("\uec77", revision=2016), "\u9fd0")
+        self.assertEqual(converter.convert_char("\uec77"), "\u9fd0")
+        self.assertEqual(converter.convert_string("\uec77", revision=1995), "\uec77")
+        self.assertFalse(converter.needs_conversion("\uec77", revision=1995))
+
+    def test_files(self):
+        files = converter._get_revision_tables(2004).files
+        self.assertEqual(
+            [file["name"] for file in files],
+            ["gccs", "hkscs1999", "hkscs2001", "hkscs2001_2", "hkscs2004"],
+        )
+
+    def test_latest(self):
+        self.assertEqual(converter.fingerprint(2016), converter.fingerprint())
+        self.assertNotEqual(converter.fingerprint(2008), converter.fingerprint())
+
+    def test_compiled_once(self):
+        with mock.patch.object(
+            _lookup, "reload_tables", wraps=_lookup.reload_tables
+        ) as reload_tables:
+            for _ in range(3):
+                converter.convert_string("\uec77", revision=2004)
+                converter.convert_many(["\uec77"], revision=2004)
+        reload_tables.assert_called_once()
+
+    def test_between_revisions(self):
+        # Years between revisions convert like the revision before them, with the same tables
+        with mock.patch.object(
+            _lookup, "reload_tables", wraps=_lookup.reload_tables
+        ) as reload_tables:
+            tables = converter._get_revision_tables(2004)
+            for revision in [2005, 2006, 2007]:
+                self.assertIs(converter._get_revision_tables(revision), tables)
+        reload_tables.assert_called_once()
+
+    def test_latest_tables(self):
+        # The latest revision and any later year use the default tables, without compiling anything
+        with mock.patch.object(_lookup, "reload_tables") as reload_tables:
+            for revision in [2016, 2020]:
+                self.assertIs(
+                    converter._get_revision_tables(revision), converter._get_tables()
+                )
+        reload_tables.assert_not_called()
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            converter.convert_string("a", revision=1990)
+        with self.assertRaises(TypeError):
+            converter.convert_string("a", revision="2004")
+
+
+class TestConverter(ReloadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.overlay = write_overlay(self.directory)
+
+    def test_default(self):
+        # Without files or overlays, the module's own tables are used
+        self.assertIs(converter.Converter()._tables(), self.tables)
+        self.assertIs(
+            converter.Converter(revision=2008)._tables(),
+            converter._get_revision_tables(2008),
+        )
+        self.assertEqual(converter.Converter().convert_string("\uec77"), "鿐")
+
+    def test_files(self):
+        # EC77 -> 4CA4 comes from HKSCS-1999, and E53B -> 3D1D -> 2A3ED from GCCS and HKSCS-2016
+        tenant = converter.Converter(files=["hkscs2016", "gccs"])
+        self.assertEqual(tenant.convert_char("\uec77"), "\uec77")
+        self.assertEqual(tenant.convert_char("\ue53b"), "\U0002a3ed")
+        self.assertEqual(
+            converter.Converter(files=["hkscs1999"]).convert_string("\uec77"), "䲤"
+        )
+        self.assertEqual(
+            [file["name"] for file in tenant._tables().files], ["gccs", "hkscs2016"]
+        )
+        self.assertNotEqual(tenant.fingerprint(), converter.fingerprint())
+
+    def test_shared(self):
+        files = ["gccs", "hkscs1999", "hkscs2001"]
+        with mock.patch.object(
+            _lookup, "reload_tables", wraps=_lookup.reload_tables
+        ) as reload_tables:
+            first = converter.Converter(files=files)
+            second = converter.Converter(files=reversed(files))
+            self.assertIs(first.translation_table, second.translation_table)
+        reload_tables.assert_called_once()
+
+        # Outputs in common with the module's tables aren't copied
+        self.assertIs(
+            first.translation_table[0xE7D4], self.tables.translation_table[0xE7D4]
+        )
+        self.assertIs(first.pattern, second.pattern)
+
+    def test_parsed_once(self):
+        # Every configuration is compiled from the same parsed mappings, even without the on-disk cache
+        with mock.patch.dict(os.environ, {_loader.CACHE_VARIABLE: ""}):
+            with mock.patch.object(
+                _loader, "load_mappings", wraps=_loader.load_mappings
+            ) as load_mappings:
+                converter.Converter(files=["gccs", "hkscs1999"]).warmup()
+                converter.Converter(files=["gccs", "hkscs2016"]).warmup()
+                converter.Converter(revision=2004).warmup()
+        parsed = [
+            file["name"] for call in load_mappings.call_args_list for file in call[0][0]
+        ]
+        self.assertEqual(sorted(parsed), sorted(set(parsed)))
+        self.assertIn("gccs", parsed)
+
+    def test_shared_tables(self):
+        # Selecting every file compiles the same table, so nothing needs to be kept twice
+        names = [file["name"] for file in self.tables.files]
+        tables = converter.Converter(files=names)._tables()
+        self.assertIsNot(tables, self.tables)
+        self.assertIs(tables.translation_table, self.tables.translation_table)
+        self.assertIs(tables.pua_table, self.tables.pua_table)
+        self.assertIs(tables.pattern, self.tables.pattern)
+
+    def test_shared_revision(self):
+        # Years between revisions share the tables of the revision before them
+        files = ["gccs", "hkscs1999"]
+        self.assertIs(
+            converter.Converter(files=files, revision=2005)._tables(),
+            converter.Converter(files=files, revision=2004)._tables(),
+        )
+        self.assertIs(
+            converter.Converter(files=files, revision=2020)._tables(),
+            converter.Converter(files=files)._tables(),
+        )
+
+    def test_overlays(self):
+        tenant = converter.Converter(overlays=[self.overlay])
+        self.assertEqual(tenant.convert_string("\ue6c6\ue7d4"), "一啱")
+        self.assertEqual(converter.convert_string("\ue6c6"), "\ue6c6")
+        self.assertTrue(tenant.needs_conversion("\U000f0000"))
+        self.assertEqual(next(tenant.convert_many(["\ue6c6"], lazy=True)), "一")
+
+    def test_bmp_only(self):
+        tenant = converter.Converter(bmp_only=True)
+        self.assertEqual(tenant.convert_string("\uf308\ue7d4"), "\uf308啱")
+        self.assertEqual(
+            tenant.convert_string("\uf308", on_astral=lambda char, output: "?"), "?"
+        )
+        self.assertEqual(tenant.astral_skipped(), converter.astral_skipped())
+        self.assertEqual(
+            tenant.convert_string_stamped("\ue7d4"),
+            ("啱", converter.fingerprint(bmp_only=True)),
+        )
+        with self.assertRaises(ValueError):
+            converter.Converter().convert_char("\uf308", on_astral=lambda *args: "?")
+
+    def test_offsets(self):
+        tenant = converter.Converter(files=["hkscs2008"])
+        converted, offsets = tenant.convert_string_with_offsets("E\uf327E")
+        self.assertEqual((converted, list(offsets)), ("EÊ̌E", [0, 1, 3, 4]))
+
+    def test_reload(self):
+        tenant = converter.Converter(overlays=[self.overlay])
+        tables = tenant._tables()
+        converter.reload()
+        self.assertIsNot(tenant._tables(), tables)
+        self.assertEqual(tenant.convert_char("\ue6c6"), "一")
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            converter.Converter(files="gccs")
+        with self.assertRaises(TypeError):
+            converter.Converter(revision="2004")
+        with self.assertRaises(TypeError):
+            converter.Converter(overlays=self.overlay)
+        with self.assertRaises(ValueError):
+            converter.Converter(files=["gccs", "hkscs2024"]).warmup()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from hkscs_unicode_converter import build, converter
+from hkscs_unicode_converter.mapped import MAGIC, MappedTable, pack_table
+
+
+class TestMappedTable(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, "compiled.bin")
+        build.main(["--target", "binary", "--output", cls.path])
+        cls.table = MappedTable(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.table.close()
+        cls.directory.cleanup()
+
+    def test_same_as_converter(self):
+        codepoints = list(range(0xE000, 0xF900)) + list(converter.translation_table)
+        for codepoint in codepoints:
+            char = chr(codepoint)
+            self.assertEqual(
+                self.table.convert_char(char), converter.convert_char(char)
+            )
+
+    def test_lookup(self):
+        self.assertEqual(self.table.lookup(0xE7D4), "啱")
+        self.assertEqual(self.table.lookup(0xF327), "Ê̌")
+        self.assertEqual(self.table.lookup(0x3D1D), chr(0x2A3ED))
+        self.assertIsNone(self.table.lookup(ord("a")))
+        self.assertIsNone(self.table.lookup(0xE000 - 1))
+
+    def test_string(self):
+        string = "唔\ue7d4牙 \uecd1 \uf327 \uf308"
+        self.assertEqual(
+            self.table.convert_string(string), converter.convert_string(string)
+        )
+        self.assertEqual(self.table.pattern.pattern, converter.pattern.pattern)
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            self.table.convert_char(1)
+        with self.assertRaises(ValueError):
+            self.table.convert_char("ab")
+        with self.assertRaises(TypeError):
+            self.table.convert_string(None)
+
+
+class TestInvalidFile(TestCase):
+    def open_with(self, contents):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "compiled.bin")
+            with open(path, "wb") as f:
+                f.write(contents)
+            MappedTable(path).close()
+
+    def test_bad_magic(self):
+        with self.assertRaises(ValueError):
+            self.open_with(b"NOTATABLE" * 8)
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            self.open_with(MAGIC + b"\x01\x00")
+
+    def test_truncated_body(self):
+        # The header is intact, but the entries it describes are cut off
+        with self.assertRaises(ValueError):
+            self.open_with(pack_table(converter.translation_table)[:200])
+
+    def test_rebuilt_while_mapped(self):
+        # The file is replaced rather than rewritten, so tables that have it mapped keep working
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "compiled.bin")
+            build.main(["--target", "binary", "--output", path])
+            with MappedTable(path) as table:
+                inode = os.stat(path).st_ino
+                build.main(["--target", "binary", "--output", path])
+                self.assertNotEqual(os.stat(path).st_ino, inode)
+                self.assertEqual(table.convert_string("\uecd1" * 3), "嘅" * 3)
+            self.assertEqual(os.listdir(directory), ["compiled.bin"])
+
+    def test_context_manager(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "compiled.bin")
+            build.main(["--target", "binary", "--output", path])
+            with MappedTable(path) as table:
+                self.assertEqual(table.convert_char("\uecd1"), "嘅")
+            self.assertTrue(table._mmap.closed)
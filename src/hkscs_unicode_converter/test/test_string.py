@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from hkscs_unicode_converter import converter
+from hkscs_unicode_converter import _loader, _lookup, converter
 
 
 class TestValid(TestCase):
@@ -71,6 +71,16 @@ class TestValid(TestCase):
         res = converter.convert_string("1A한\uF327አ啱අاَ☃️")
         self.assertEqual(res, "1A한Ê̌አ啱咗අاَ☃️")
 
+    def test_translation_table(self):
+        res = "唔\ue7d4牙\uf327".translate(converter.translation_table)
+        self.assertEqual(res, "唔啱牙Ê̌")
+
+    def test_translation_table_read_only(self):
+        # Changing it would make convert_string() and convert_char() disagree
+        with self.assertRaises(TypeError):
+            converter.translation_table[0xE7D4] = "x"
+        self.assertEqual(converter.convert_string("\ue7d4"), "啱")
+
 
 class TestInvalid(TestCase):
     def test_no_arg(self):
@@ -153,3 +163,232 @@ class TestNoChangeNeeded(TestCase):
     def test_many_writing_systems(self):
         res = converter.convert_string("1A한Ê̌አ啱咗අاَ☃️")
         self.assertEqual(res, "1A한Ê̌አ啱咗අاَ☃️")
+
+    # Strings that don't need converting should be returned as-is
+    def test_same_object(self):
+        string = "唔啱牙" * 10
+        res = converter.convert_string(string)
+        self.assertIs(res, string)
+
+
+class TestNeedsConversion(TestCase):
+    def test_empty(self):
+        self.assertFalse(converter.needs_conversion(""))
+
+    def test_ascii(self):
+        self.assertFalse(converter.needs_conversion("Hi!"))
+
+    def test_latin(self):
+        self.assertFalse(converter.needs_conversion("Ê̌"))
+
+    def test_cjk(self):
+        self.assertFalse(converter.needs_conversion("唔啱牙"))
+
+    def test_hkscs(self):
+        self.assertTrue(converter.needs_conversion("唔牙"))
+
+    def test_remapped_outside_pua(self):
+        self.assertTrue(converter.needs_conversion(chr(0x4CA4)))
+
+    def test_not_string(self):
+        with self.assertRaises(TypeError):
+            converter.needs_conversion(-1)
+
+
+class TestPattern(TestCase):
+    def test_finditer(self):
+        matches = converter.pattern.finditer("唔牙" + chr(0x4CA4))
+        self.assertEqual([match.start() for match in matches], [1, 3, 4])
+
+    def test_no_match(self):
+        self.assertIsNone(converter.pattern.search("唔啱牙 Hi! 👍🏽"))
+
+    def test_every_key(self):
+        # The pattern should match exactly the characters that convert_char changes
+        for codepoint in range(0x30000):
+            char = chr(codepoint)
+            self.assertEqual(
+                bool(converter.pattern.match(char)),
+                converter.convert_char(char) != char,
+            )
+
+    def test_same_as_convert_char(self):
+        string = "".join([chr(codepoint) for codepoint in range(0xE000, 0xF900)])
+        res = converter.convert_string(string)
+        self.assertEqual(
+            res, "".join([converter.convert_char(char) for char in string])
+        )
+
+
+class TestStrategies(TestCase):
+    # Long strings should give the same results whichever strategy is picked
+    def test_long_sparse(self):
+        res = converter.convert_string("唔啱牙" * 100 + "唔牙" + "唔啱牙" * 100)
+        self.assertEqual(res, "唔啱牙" * 201)
+
+    def test_long_dense(self):
+        res = converter.convert_string("亂廿四" * 100)
+        self.assertEqual(res, "亂噏廿四" * 100)
+
+    def test_long_sparse_after_dense_prefix(self):
+        res = converter.convert_string("" * 100 + "唔啱牙" * 100 + "")
+        self.assertEqual(res, "噏" * 100 + "唔啱牙" * 100 + "噏")
+
+    def test_long_same_object(self):
+        string = "唔啱牙" * 1000
+        self.assertIs(converter.convert_string(string), string)
+
+    def test_long_ascii_same_object(self):
+        string = "Hi!" * 1000
+        self.assertIs(converter.convert_string(string), string)
+
+
+class TestConvertMany(TestCase):
+    def test_list(self):
+        res = converter.convert_many(["唔牙", "Hi!", "唔牙", ""])
+        self.assertEqual(res, ["唔啱牙", "Hi!", "唔啱牙", "Ê̌"])
+
+    def test_lazy(self):
+        res = converter.convert_many(iter(["唔牙", "Hi!"]), lazy=True)
+        self.assertEqual(next(res), "唔啱牙")
+        self.assertEqual(next(res), "Hi!")
+        with self.assertRaises(StopIteration):
+            next(res)
+
+    def test_duplicates_converted_once(self):
+        res = converter.convert_many(["唔牙"] * 3)
+        self.assertIs(res[0], res[1])
+        self.assertIs(res[0], res[2])
+
+    def test_empty(self):
+        self.assertEqual(converter.convert_many([]), [])
+
+    def test_string(self):
+        with self.assertRaises(TypeError):
+            converter.convert_many("唔牙")
+
+    def test_not_string(self):
+        with self.assertRaises(TypeError):
+            converter.convert_many(["唔牙", -1])
+
+    def test_not_iterable(self):
+        with self.assertRaises(TypeError):
+            converter.convert_many(-1)
+
+
+class TestOffsets(TestCase):
+    def test_unchanged(self):
+        res, offsets = converter.convert_string_with_offsets("Hi!")
+        self.assertEqual(res, "Hi!")
+        self.assertEqual(list(offsets), [0, 1, 2, 3])
+
+    def test_same_length(self):
+        res, offsets = converter.convert_string_with_offsets("唔牙")
+        self.assertEqual(res, "唔啱牙")
+        self.assertEqual(list(offsets), [0, 1, 2, 3])
+
+    def test_weird_edge_case(self):
+        # U+F327 becomes two codepoints, so everything after it moves along by one
+        res, offsets = converter.convert_string_with_offsets("EEEE")
+        self.assertEqual(res, "EEÊ̌EE")
+        self.assertEqual(list(offsets), [0, 1, 2, 4, 5, 6])
+
+    def test_span(self):
+        string = "EE唔牙"
+        res, offsets = converter.convert_string_with_offsets(string)
+        start, end = string.index("唔"), len(string)
+        self.assertEqual(res[offsets[start] : offsets[end]], "唔啱牙")
+
+    def test_utf16(self):
+        # U+F308 -> U+2010C needs a surrogate pair, U+E7D4 -> U+5571 stays in the BMP
+        res, offsets = converter.convert_string_with_offsets("\U0001f44d", utf16=True)
+        self.assertEqual(res, "\U0001f44d\U0002010c啱")
+        self.assertEqual(list(offsets), [0, 1, 2, 4, 5])
+
+    def test_utf16_astral_input(self):
+        # U+2A3ED was swapped with U+3D1D in HKSCS-2016, so the string gets shorter
+        res, offsets = converter.convert_string_with_offsets("\U0002a3ed䲤", utf16=True)
+        self.assertEqual(res, "㴝鿐")
+        self.assertEqual(list(offsets), [0, 0, 1, 2])
+
+    def test_not_string(self):
+        with self.assertRaises(TypeError):
+            converter.convert_string_with_offsets(-1)
+
+
+class TestFingerprint(TestCase):
+    def test_stable(self):
+        # If the mappings were changed on purpose, update this to the new fingerprint
+        self.assertEqual(
+            converter.fingerprint(),
+            "daa0ba36a3b6419fa2c5397f7505d68d93928bcaf7ae6cffc78ff20de76fa920",
+        )
+
+    def test_same_as_data_files(self):
+        _, files = _loader.load_config()
+        table, _ = _loader.compile_table(_loader.load_mappings(files))
+        self.assertEqual(_lookup.fingerprint_table(table), converter.fingerprint())
+
+    def test_changes_with_table(self):
+        table = dict(converter.translation_table)
+        table[0xE7D4] = "x"
+        self.assertNotEqual(_lookup.fingerprint_table(table), converter.fingerprint())
+        del table[0xE7D4]
+        self.assertNotEqual(_lookup.fingerprint_table(table), converter.fingerprint())
+
+    def test_stamped(self):
+        self.assertEqual(
+            converter.convert_string_stamped("唔\ue7d4牙"),
+            ("唔啱牙", converter.fingerprint()),
+        )
+        with self.assertRaises(TypeError):
+            converter.convert_string_stamped(None)
+
+
+class TestBmpOnly(TestCase):
+    def test_convert(self):
+        # F308 converts to U+2010C, in CJK Extension B
+        self.assertEqual(
+            converter.convert_string("\uf308\ue7d4", bmp_only=True), "\uf308啱"
+        )
+        self.assertEqual(converter.convert_char("\uf308", bmp_only=True), "\uf308")
+        self.assertEqual(converter.convert_char("\uf327", bmp_only=True), "Ê̌")
+        self.assertEqual(converter.convert_string("\uf308"), "\U0002010c")
+
+    def test_on_astral(self):
+        calls = []
+
+        def on_astral(char, output):
+            calls.append((char, output))
+            return "?"
+
+        res = converter.convert_string(
+            "\uf308\ue7d4\uf308", bmp_only=True, on_astral=on_astral
+        )
+        self.assertEqual(res, "?啱?")
+        self.assertEqual(calls, [("\uf308", "\U0002010c")] * 2)
+        self.assertEqual(
+            converter.convert_char("\uf308", bmp_only=True, on_astral=on_astral), "?"
+        )
+        with self.assertRaises(ValueError):
+            converter.convert_string("\uf308", on_astral=on_astral)
+
+    def test_table(self):
+        bmp_table = converter._tables_for(None, bmp_only=True).translation_table
+        self.assertLessEqual(max(map(max, bmp_table.values())), "\uffff")
+        self.assertEqual(
+            len(bmp_table) + converter.astral_skipped(),
+            len(converter.translation_table),
+        )
+        self.assertEqual(converter.astral_skipped(), 1713)
+        tables = converter._tables_for(None, bmp_only=True)
+        self.assertIs(tables.translation_table, bmp_table)
+
+    def test_other_functions(self):
+        self.assertFalse(converter.needs_conversion("\uf308", bmp_only=True))
+        self.assertEqual(
+            converter.convert_many(["\uf308\ue7d4"], bmp_only=True), ["\uf308啱"]
+        )
+        self.assertNotEqual(
+            converter.fingerprint(bmp_only=True), converter.fingerprint()
+        )